@@ -0,0 +1,370 @@
+import sys
+import csv
+import json
+import math
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from os import path
+import argparse
+import logging
+
+import knapsack
+import run
+import generate
+
+'''
+    Benchmarks the solver inside this process: every instance is solved a few times to warm up, then
+    timed over repeated runs with time.perf_counter, and once more under tracemalloc for the peak memory
+    of every stage. The total profits are checked against the known optima, where there are any.
+
+    The results go to a JSON or CSV file together with the git revision, and two result files can be
+    compared to flag regressions:
+
+        python bench.py --options='--numpy' madcat/inst/kp --family strongly:1000:10000 --output new.json
+        python bench.py --compare old.json new.json
+
+    With --session, the incremental updates of a KnapsackSession are benchmarked instead, against solving
+    every updated instance from scratch:
+
+        python bench.py --session --updates 10 --family uncorrelated:100:100
+'''
+
+'''
+    Parses a family of synthetic instances like strongly:1000:10000, that is the family name, the number of
+    items and the coefficient range.
+'''
+def parse_family(spec):
+    family, num_items, coefficient_range = spec.split(':')
+    if family not in generate.FAMILIES:
+        raise argparse.ArgumentTypeError(f'Unknown family {family}, choose one of {", ".join(generate.FAMILIES)}')
+    return family, int(num_items), int(coefficient_range)
+
+'''
+    Reads the known optimum of the given .kp file from the file next to it with the extension .opt. This
+    file looks like a solution written by knapsack.write_solution: its line starting with p holds the
+    optimal total profit, and any other lines are ignored.
+
+    @return the optimal total profit, or None if it is not known
+'''
+def read_known_optimum(filepath):
+    optimum_filepath = path.splitext(filepath)[0] + '.opt'
+    if not path.exists(optimum_filepath):
+        return None
+    with open(optimum_filepath) as f:
+        for line in f:
+            info = line.split()
+            if len(info) == 2 and info[0] == 'p':
+                return knapsack.parse_number(info[1].encode())
+    return None
+
+'''
+    Gets the git revision of the checkout of this script, marked as dirty if it has changes.
+
+    @return the revision, or None outside of a git checkout
+'''
+def git_revision():
+    directory = path.dirname(path.abspath(__file__))
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, check=True,
+            capture_output=True, text=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+            check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + '-dirty' if changes else revision
+
+'''
+    Gets the p-th percentile of the given values by the nearest rank.
+'''
+def percentile(values, p):
+    ranked = sorted(values)
+    return ranked[max(0, math.ceil(p / 100 * len(ranked)) - 1)]
+
+'''
+    Solves the given instance once with the options of the solver, and records its metrics.
+
+    @return the total profit and the metrics
+'''
+def solve_once(knapsack_problem, solver_args):
+    metrics = knapsack.Metrics()
+    start_time = time.perf_counter()
+    taken_profit, _, _ = knapsack.solve_with_args(knapsack_problem, solver_args, metrics=metrics)
+    metrics.add_time('total', time.perf_counter() - start_time)
+    return taken_profit, metrics
+
+'''
+    Benchmarks one instance: solves it in some warmup runs, which are not measured, then in the given
+    number of timed runs, and finally once under tracemalloc to measure the peak memory of every stage.
+    The solution cache is never used, so that every run really solves.
+
+    @param expected the known optimal total profit, or None
+    @return dictionary of the result
+'''
+def bench_instance(name, knapsack_problem, solver_args, warmup, repeats, expected=None):
+    for _ in range(warmup):
+        solve_once(knapsack_problem, solver_args)
+
+    stage_times = dict()
+    for _ in range(repeats):
+        taken_profit, metrics = solve_once(knapsack_problem, solver_args)
+        for stage, seconds in metrics.stage_times.items():
+            stage_times.setdefault(stage, []).append(seconds)
+
+    tracemalloc.start()
+    try:
+        _, memory_metrics = solve_once(knapsack_problem, solver_args)
+    finally:
+        tracemalloc.stop()
+
+    correct = None
+    if expected is not None:
+        correct = taken_profit == expected
+        if not correct:
+            logging.error(f'{name}: total profit {taken_profit}, but the known optimum is {expected}')
+    return {
+        'instance': name,
+        'num_items': len(knapsack_problem[1]),
+        'capacity': knapsack_problem[0],
+        'total_profit': taken_profit,
+        'expected': expected,
+        'correct': correct,
+        'runs': repeats,
+        'stages': {stage: {
+                'median': statistics.median(times),
+                'p95': percentile(times, 95),
+                'peak_memory': memory_metrics.stage_memory.get(stage)
+            } for stage, times in stage_times.items()},
+        'levels': {level_name: level['total'] for level_name, level in memory_metrics.to_dict()['levels'].items()},
+        'counters': memory_metrics.counters
+    }
+
+'''
+    Applies one random update of the given kind to the items and capacity of a KnapsackSession: adds an item,
+    removes one, or lowers the capacity to somewhere between half and all of the given capacity.
+
+    @return the capacity after the update
+'''
+def apply_update(session, knapsack_items, capacity, kind, coefficient_range, rng):
+    if kind == 'add':
+        item = knapsack.Item(max(item.id for item in knapsack_items) + 1, rng.randint(1, coefficient_range),
+            rng.randint(1, coefficient_range))
+        knapsack_items.append(item)
+        session.add_item(item.id, item.weight, item.profit)
+    elif kind == 'remove':
+        item = knapsack_items.pop(rng.randrange(len(knapsack_items)))
+        session.remove_item(item.id)
+    else:
+        capacity = rng.randint(capacity // 2, capacity)
+        session.update_capacity(capacity)
+    return capacity
+
+'''
+    Benchmarks the incremental updates of a KnapsackSession against solving from scratch: for every kind of
+    update, the given number of random updates is applied one after the other, and every update together with
+    the following solve is timed, as is solve_knapsack on the updated instance. Both must agree on the total
+    profit.
+
+    @return list of results like bench_instance, one for every kind of update, with the stages incremental
+        and from scratch
+'''
+def bench_session(name, knapsack_problem, num_updates, seed):
+    rng = random.Random(seed)
+    results = []
+    for kind in ['add', 'remove', 'capacity']:
+        capacity, knapsack_items = knapsack_problem
+        knapsack_items = list(knapsack.ItemTable.from_items(knapsack_items))
+        coefficient_range = max(item.weight for item in knapsack_items)
+        session = knapsack.KnapsackSession((capacity, list(knapsack_items)))
+        session.solve()
+        stage_times = {'incremental': [], 'from scratch': []}
+        correct = True
+        for _ in range(num_updates):
+            start_time = time.perf_counter()
+            capacity = apply_update(session, knapsack_items, capacity, kind, coefficient_range, rng)
+            taken_profit, _, _ = session.solve()
+            stage_times['incremental'].append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            expected, _, _ = knapsack.solve_knapsack((capacity, knapsack_items))
+            stage_times['from scratch'].append(time.perf_counter() - start_time)
+            if taken_profit != expected:
+                logging.error(f'{name}: the session found total profit {taken_profit} after {kind}, '
+                    + f'but solving from scratch found {expected}')
+                correct = False
+        results.append({
+            'instance': f'{name} session {kind}',
+            'num_items': len(knapsack_items),
+            'capacity': capacity,
+            'total_profit': taken_profit,
+            'expected': expected,
+            'correct': correct,
+            'runs': num_updates,
+            'stages': {stage: {
+                    'median': statistics.median(times),
+                    'p95': percentile(times, 95),
+                    'peak_memory': None
+                } for stage, times in stage_times.items()}
+        })
+    return results
+
+'''
+    Yields the instances to benchmark: the .kp files under the given paths with their known optima, and
+    the synthetic instances of the given families with the optima of the reference engine.
+
+    @return generator of the name, the instance and the known optimal total profit or None
+'''
+def iterate_instances(input_paths, families, seed):
+    for filepath in run.collect_input_paths(input_paths):
+        knapsack_problem = knapsack.load_knapsack(filepath)
+        if knapsack_problem is None:
+            logging.error(f'Skipping {filepath}, because it has no capacity line')
+            continue
+        yield filepath, knapsack_problem, read_known_optimum(filepath)
+    for family, num_items, coefficient_range in families:
+        knapsack_problem = generate.make_instance(family, num_items, coefficient_range, seed)
+        expected = generate.reference_profit(knapsack_problem)
+        yield f'{family}:{num_items}:{coefficient_range}', knapsack_problem, expected
+
+'''
+    The default suite, when neither files nor families are given: every family at a few sizes.
+'''
+DEFAULT_FAMILIES = [(family, num_items, coefficient_range)
+    for family in generate.FAMILIES for num_items in [20, 40] for coefficient_range in [1000]]
+
+'''
+    Writes the results as JSON, or as CSV with one row for every stage of every instance, if the file name
+    ends with .csv.
+'''
+def write_results(filepath, results):
+    if not filepath.endswith('.csv'):
+        with open(filepath, 'w') as f:
+            f.write(json.dumps(results, indent=4))
+        return
+    fields = ['revision', 'options', 'instance', 'num_items', 'capacity', 'total_profit', 'expected', 'correct',
+        'runs', 'stage', 'median', 'p95', 'peak_memory']
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        for result in results['results']:
+            row = {field: result[field] for field in fields[2:9]}
+            row.update(revision=results['revision'], options=results['options'])
+            for stage, summary in result['stages'].items():
+                writer.writerow(dict(row, stage=stage, **summary))
+
+'''
+    Reads results written by write_results back into the layout of the JSON file.
+'''
+def read_results(filepath):
+    if not filepath.endswith('.csv'):
+        with open(filepath) as f:
+            return json.load(f)
+    results = {'revision': None, 'options': None, 'results': []}
+    by_instance = dict()
+    with open(filepath, newline='') as f:
+        for row in csv.DictReader(f):
+            results['revision'], results['options'] = row['revision'], row['options']
+            result = by_instance.get(row['instance'])
+            if result is None:
+                result = {'instance': row['instance'], 'correct': row['correct'] or None, 'stages': dict()}
+                by_instance[row['instance']] = result
+                results['results'].append(result)
+            result['stages'][row['stage']] = {'median': float(row['median']), 'p95': float(row['p95'])}
+    return results
+
+'''
+    Compares two result files stage by stage, and flags every stage of an instance, whose median got slower
+    by more than the given fraction, and every instance, which was solved correctly before but not now.
+    Stages faster than the given number of seconds in either file are too noisy to compare, since a stage of
+    a few microseconds can take milliseconds on the same code, when the process is interrupted.
+
+    @return list of the flagged regressions as strings
+'''
+def compare_results(old_results, new_results, threshold, min_seconds):
+    old_by_instance = {result['instance']: result for result in old_results['results']}
+    regressions = []
+    for new in new_results['results']:
+        old = old_by_instance.get(new['instance'])
+        if old is None:
+            continue
+        if old['correct'] in (True, 'True') and new['correct'] not in (True, 'True'):
+            regressions.append(f'{new["instance"]}: no longer solved correctly')
+        for stage, new_summary in new['stages'].items():
+            old_summary = old['stages'].get(stage)
+            if old_summary is None or min(old_summary['median'], new_summary['median']) < min_seconds:
+                continue
+            ratio = new_summary['median'] / old_summary['median'] if old_summary['median'] > 0 else math.inf
+            logging.info(f'{new["instance"]} {stage}: {old_summary["median"]:.6f}s -> '
+                + f'{new_summary["median"]:.6f}s ({ratio:.2f}x)')
+            if ratio > 1 + threshold:
+                regressions.append(f'{new["instance"]} {stage}: median {old_summary["median"]:.6f}s -> '
+                    + f'{new_summary["median"]:.6f}s ({ratio:.2f}x)')
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--options', '-c', type=str, default='')
+    parser.add_argument('--family', '-f', type=parse_family, action='append', default=[])
+    parser.add_argument('--seed', '-s', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', '-r', type=int, default=5)
+    parser.add_argument('--output', '-o', type=str, default='bench.json')
+    parser.add_argument('--compare', type=str, nargs=2, default=None, metavar=('OLD', 'NEW'))
+    parser.add_argument('--session', action='store_true')
+    parser.add_argument('--updates', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--min-seconds', type=float, default=0.001)
+    parser.add_argument('--verbose', '-v', action='count')
+    parser.add_argument('input_paths', type=str, nargs='*')
+    args = parser.parse_args()
+
+    log_levels = {
+        None: logging.WARNING,
+        1: logging.INFO,
+        2: logging.DEBUG
+    }
+    if args.verbose is not None and args.verbose >= len(log_levels):
+        args.verbose = len(log_levels)-1
+    logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+
+    if args.compare is not None:
+        old_results, new_results = (read_results(filepath) for filepath in args.compare)
+        regressions = compare_results(old_results, new_results, args.threshold, args.min_seconds)
+        print(f'Comparing {old_results["revision"]} with {new_results["revision"]}')
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        print(f'{len(regressions)} regressions')
+        exit(1 if regressions else 0)
+
+    if args.repeats < 1:
+        logging.error('Every instance must be solved at least once, so --repeats must be at least 1!')
+        exit(1)
+
+    solver_args = run.parse_solver_args(args.options)
+    families = args.family
+    if not args.input_paths and not families:
+        families = DEFAULT_FAMILIES
+
+    results = {
+        'revision': git_revision(),
+        'options': args.options,
+        'python': sys.version.split()[0],
+        'warmup': args.warmup,
+        'results': []
+    }
+    for name, knapsack_problem, expected in iterate_instances(args.input_paths, families, args.seed):
+        if args.session:
+            for result in bench_session(name, knapsack_problem, args.updates, args.seed):
+                results['results'].append(result)
+                incremental, scratch = result['stages']['incremental'], result['stages']['from scratch']
+                print(f'{result["instance"]}: median {incremental["median"]:.6f}s incremental, '
+                    + f'{scratch["median"]:.6f}s from scratch, correct {result["correct"]}')
+            continue
+        result = bench_instance(name, knapsack_problem, solver_args, args.warmup, args.repeats, expected)
+        results['results'].append(result)
+        total = result['stages']['total']
+        print(f'{name}: median {total["median"]:.6f}s, p95 {total["p95"]:.6f}s, '
+            + f'correct {result["correct"]}')
+    write_results(args.output, results)
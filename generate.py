@@ -0,0 +1,215 @@
+import math
+import random
+import time
+from array import array
+from os import path
+import argparse
+import logging
+
+import knapsack
+
+'''
+    Generates the classical hard Knapsack instances of Pisinger, "Where are the hard knapsack problems?",
+    and writes them in the .kp format, which knapsack.parse_knapsack reads. The weights are drawn uniformly
+    from 1 to the coefficient range R, and the profits are correlated with them as the family says.
+
+    The items are streamed to the file as they are drawn, so that instances of any size can be made without
+    holding them in memory. If a reference engine of the solver proves the optimum of the instance, it is
+    written to a .opt file next to it, as bench.py expects.
+
+        python generate.py strongly 10000 1000 --seed 3 --output strongly.kp
+'''
+
+def uncorrelated(num_items, coefficient_range, rng):
+    for _ in range(num_items):
+        yield rng.randint(1, coefficient_range), rng.randint(1, coefficient_range)
+
+def weakly_correlated(num_items, coefficient_range, rng):
+    spread = coefficient_range // 10
+    for _ in range(num_items):
+        weight = rng.randint(1, coefficient_range)
+        yield weight, max(1, rng.randint(weight - spread, weight + spread))
+
+def strongly_correlated(num_items, coefficient_range, rng):
+    for _ in range(num_items):
+        weight = rng.randint(1, coefficient_range)
+        yield weight, weight + coefficient_range // 10
+
+def inverse_strongly_correlated(num_items, coefficient_range, rng):
+    for _ in range(num_items):
+        profit = rng.randint(1, coefficient_range)
+        yield profit + coefficient_range // 10, profit
+
+def subset_sum(num_items, coefficient_range, rng):
+    for _ in range(num_items):
+        weight = rng.randint(1, coefficient_range)
+        yield weight, weight
+
+'''
+    Makes a spanner family out of the given family: a few spanner items are drawn from that family and
+    shrunk by half the multiplier limit, and every item is a spanner item multiplied by a random number from
+    1 to the multiplier limit.
+
+    @param num_spanners the number of spanner items, 2 in the paper
+    @param max_multiplier the multiplier limit, 10 in the paper
+    @return function generating the pairs of weight and profit of the spanner family
+'''
+def spanner(family, num_spanners=2, max_multiplier=10):
+    def spanner_family(num_items, coefficient_range, rng):
+        spanners = [(math.ceil(2 * weight / max_multiplier), math.ceil(2 * profit / max_multiplier))
+            for weight, profit in family(num_spanners, coefficient_range, rng)]
+        for _ in range(num_items):
+            weight, profit = rng.choice(spanners)
+            multiplier = rng.randint(1, max_multiplier)
+            yield multiplier * weight, multiplier * profit
+    return spanner_family
+
+'''
+    The families by their name. Every family is a function of the number of items, the coefficient range
+    and the random generator, which generates the pairs of weight and profit of the items.
+'''
+FAMILIES = {
+    'uncorrelated': uncorrelated,
+    'weakly': weakly_correlated,
+    'strongly': strongly_correlated,
+    'inverse-strongly': inverse_strongly_correlated,
+    'subset-sum': subset_sum,
+    'spanner-uncorrelated': spanner(uncorrelated),
+    'spanner-weakly': spanner(weakly_correlated),
+    'spanner-strongly': spanner(strongly_correlated)
+}
+
+# characters reserved for the capacity line, which is only known after all items are written
+CAPACITY_LINE_WIDTH = 32
+
+# number of item lines written at once
+LINES_PER_WRITE = 1 << 16
+
+'''
+    Gets the capacity for items of the given total weight as the given fraction of it, like Pisinger takes
+    the fraction h/(H+1) for the h-th of H instances of a series.
+'''
+def make_capacity(total_weight, capacity_fraction):
+    return max(1, int(total_weight * capacity_fraction))
+
+'''
+    Makes a random instance of the given family in memory.
+
+    @return the capacity and the item table, like knapsack.load_knapsack
+'''
+def make_instance(family, num_items, coefficient_range, seed, capacity_fraction=0.5):
+    weights, profits = array('q'), array('q')
+    for weight, profit in FAMILIES[family](num_items, coefficient_range, random.Random(seed)):
+        weights.append(weight)
+        profits.append(profit)
+    capacity = make_capacity(sum(weights), capacity_fraction)
+    return capacity, knapsack.ItemTable(array('q', range(1, num_items+1)), weights, profits)
+
+'''
+    Writes a random instance of the given family to the given file, streaming the items as they are drawn.
+    The capacity line comes first, but the capacity depends on the total weight, so a line of blanks is
+    reserved for it and filled in at the end.
+
+    @return the capacity
+'''
+def write_instance(filepath, family, num_items, coefficient_range, seed, capacity_fraction=0.5):
+    total_weight = 0
+    with open(filepath, 'w') as f:
+        f.write(f'c {family} n {num_items} range {coefficient_range} seed {seed}\n')
+        capacity_position = f.tell()
+        f.write(' ' * (CAPACITY_LINE_WIDTH - 1) + '\n')
+        lines = []
+        for weight, profit in FAMILIES[family](num_items, coefficient_range, random.Random(seed)):
+            total_weight += weight
+            lines.append(f'{weight} {profit}\n')
+            if len(lines) == LINES_PER_WRITE:
+                f.write(''.join(lines))
+                lines = []
+        f.write(''.join(lines))
+
+        capacity = make_capacity(total_weight, capacity_fraction)
+        capacity_line = f't {capacity}'
+        if len(capacity_line) >= CAPACITY_LINE_WIDTH:
+            raise ValueError(f'The capacity {capacity} does not fit into the reserved line')
+        f.seek(capacity_position)
+        f.write(capacity_line)
+    return capacity
+
+'''
+    Solves the given instance with a reference engine of the solver, to know its optimum.
+
+    The capacity array runs knapsack.capacity_dp directly on the raw items, without the cleaning and the
+    reduction of knapsack.solve_knapsack, so that the optimum does not rely on the code it is meant to check.
+    It is only tried for integer weights and at most knapsack.MAX_ARRAY_CELLS cells. The other engines go
+    through knapsack.solve_knapsack, but without the reduction. Branch-and-bound stops at the time limit, and
+    then the optimum is not known.
+
+    @return the optimal total profit, or None if the engine could not prove it
+'''
+def reference_profit(knapsack_problem, engine='array', time_limit=None):
+    capacity, knapsack_items = knapsack_problem
+    if engine == 'array':
+        knapsack_items = knapsack.ItemTable.from_items(knapsack_items)
+        weights, profits = list(knapsack_items.weights), list(knapsack_items.profits)
+        if not knapsack.is_integral(weights, capacity) or len(weights) * (capacity + 1) > knapsack.MAX_ARRAY_CELLS:
+            return None
+        taking = knapsack.capacity_dp(weights, profits, capacity, knapsack.np is not None)
+        return sum(profits[i] for i in taking)
+    report = dict()
+    taken_profit, _, _ = knapsack.solve_knapsack(knapsack_problem, use_numpy=knapsack.np is not None,
+        reduce=False, engine=engine, time_limit=time_limit, report=report)
+    return taken_profit if report['optimal'] else None
+
+'''
+    Writes the optimal total profit into the .opt file next to the given .kp file.
+'''
+def write_known_optimum(filepath, taken_profit):
+    with open(path.splitext(filepath)[0] + '.opt', 'w') as f:
+        f.write(f'p {taken_profit}\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('family', choices=list(FAMILIES))
+    parser.add_argument('num_items', type=int)
+    parser.add_argument('coefficient_range', type=int)
+    parser.add_argument('--seed', '-s', type=int, default=1)
+    parser.add_argument('--capacity-fraction', type=float, default=0.5)
+    parser.add_argument('--output', '-o', type=str, default=None)
+    parser.add_argument('--reference', '-r', choices=['array', 'intervals', 'middle', 'branch', 'auto', 'none'],
+        default='array')
+    parser.add_argument('--time-limit', '-t', type=float, default=None)
+    parser.add_argument('--verbose', '-v', action='count')
+    args = parser.parse_args()
+
+    log_levels = {
+        None: logging.WARNING,
+        1: logging.INFO,
+        2: logging.DEBUG
+    }
+    if args.verbose is not None and args.verbose >= len(log_levels):
+        args.verbose = len(log_levels)-1
+    logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+
+    if args.num_items < 0 or args.coefficient_range < 1:
+        logging.error('The number of items must not be negative, and the coefficient range must be positive!')
+        exit(1)
+    filepath = args.output
+    if filepath is None:
+        filepath = f'{args.family}_{args.num_items}_{args.coefficient_range}_{args.seed}.kp'
+
+    start_time = time.perf_counter()
+    capacity = write_instance(filepath, args.family, args.num_items, args.coefficient_range, args.seed,
+        args.capacity_fraction)
+    logging.info(f'Wrote {filepath} with capacity {capacity} in {time.perf_counter() - start_time:.3f}s')
+
+    # the capacity array is ruled out before the instance is loaded, since it may be far too large for it
+    if args.reference == 'array' and args.num_items * (capacity + 1) > knapsack.MAX_ARRAY_CELLS:
+        logging.warning(f'The capacity array is too large for {filepath}, so its optimum is not known')
+    elif args.reference != 'none':
+        start_time = time.perf_counter()
+        optimum = reference_profit(knapsack.load_knapsack(filepath), args.reference, args.time_limit)
+        if optimum is None:
+            logging.warning(f'The {args.reference} engine could not solve {filepath}, so its optimum is not known')
+        else:
+            write_known_optimum(filepath, optimum)
+            logging.info(f'Found the optimum {optimum} in {time.perf_counter() - start_time:.3f}s')
@@ -1,9 +1,11 @@
 import sys
+from os import path
 
 '''
     Convert the set of three files per instance from
     https://people.sc.fsu.edu/~jburkardt/datasets/knapsack_01/knapsack_01.html
     to one file in my .kp format, which is similar to the .gr format from PACE challenges.
+    The optimal selection, if there is one, becomes the known optimum in a .opt file next to it.
 '''
 
 prefix = sys.argv[1]
@@ -26,3 +28,9 @@ with open(f'{prefix}.kp', 'w') as f:
     f.write(f't {total_capacity}\n')
     for w, p in zip(weights, profits):
         f.write(f'{w} {p}\n')
+
+if path.exists(f'{prefix}_s.txt'):
+    with open(f'{prefix}_s.txt') as f:
+        selection = [int(line) for line in f if line.strip()]
+    with open(f'{prefix}.opt', 'w') as f:
+        f.write(f'p {sum(profit for profit, taken in zip(profits, selection) if taken)}\n')
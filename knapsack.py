@@ -1,9 +1,32 @@
+import os
 import sys
 import json
+import mmap
+import re
+import struct
 from os import path
 import time
 import logging
 import argparse
+import math
+import hashlib
+import tracemalloc
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from array import array
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 '''
     Computes a list for a given list of numbers. This list has length len(numbers)+1. This list contains
@@ -11,48 +34,90 @@ import argparse
     zero elements of the given list, that is [0]. The second includes the first element a of the given list
     and as such contains [0, a] and so on.
 
-    @param numbers given list of numbers, whose partial sums are to be computed
-    @return list of partial sums of given list
+    Every list of sums is sorted ascendingly and free of duplicates. The next list is a merge of the previous
+    list with the previous list shifted by the next number. A set of all sums seen so far tells which shifted sums
+    are new, and since both the previous list and the new shifted sums are sorted, sorting their concatenation
+    is a linear merge of two runs.
+
+    If a bound is given, every list keeps only its sums up to the bound and, as a sentinel, the smallest sum
+    above the bound. This sentinel is exact, because the smallest sum above the bound of the next list is either
+    the previous sentinel or some kept sum shifted by the next number.
+
+    @param numbers given list of non-negative numbers, whose partial sums are to be computed
+    @param bound optional number, above which all sums except the smallest one are dropped
+    @return list of sorted partial sums of given list
 '''
-def make_sum_combinations(numbers):
+def make_sum_combinations(numbers, bound=None):
     sum_lists = [[0]]
-    w = 1
-    logging.debug(f'There are {len(numbers)} numbers to make sums of')
-    for number in numbers:
-        prior_sums = sum_lists[-1]
-        next_sums = list(prior_sums)
-        for prior_sum in prior_sums:
-            new_sum = number + prior_sum
-            if new_sum not in next_sums:
-                next_sums.append(new_sum)
+    seen_sums = {0}
+    logging.debug('There are %d numbers to make sums of', len(numbers))
+    for w, number in enumerate(numbers, 1):
+        next_sums = add_to_sums(sum_lists[-1], number, bound, seen_sums)
         sum_lists.append(next_sums)
-        logging.debug(f'Computed {len(next_sums)} sums up to {w}th number')
-        logging.debug(f'The sums are\n{next_sums}')
-        w += 1
+        logging.debug('Computed %d sums up to %dth number', len(next_sums), w)
+        logging.debug('The sums are\n%s', next_sums)
     return sum_lists
 
+'''
+    Computes the next list of sums of make_sum_combinations from the previous one and the next number.
+
+    @param prior_sums sorted list of sums without duplicates
+    @param number the next number
+    @param bound optional number, above which all sums except the smallest one are dropped
+    @param seen_sums optional set of all prior sums, which is updated with the new sums
+    @return sorted list of the prior sums and the prior sums shifted by the number
+'''
+def add_to_sums(prior_sums, number, bound=None, seen_sums=None):
+    if seen_sums is None:
+        seen_sums = set(prior_sums)
+    shifted_sums = prior_sums
+    if bound is not None:
+        # only the sums up to the bound and the first one above it can end up in the next list
+        shifted_sums = prior_sums[:bisect_right(prior_sums, bound - number) + 1]
+    new_sums = [prior_sum + number for prior_sum in shifted_sums if prior_sum + number not in seen_sums]
+    seen_sums.update(new_sums)
+    next_sums = prior_sums + new_sums
+    next_sums.sort()
+    if bound is not None:
+        del next_sums[bisect_right(next_sums, bound) + 1:]
+    return next_sums
+
 '''
     Computes a list of all non-empty, partial sums of the first so-and-so-many weights,
     going from left to right. The list of non-empty, partial sums of the first zero weights,
     that is the empty list, is left out. Additionally, every computed list contains two additional elements:
     the negative and positive infinity.
 
+    If the capacity is given, the sums above the capacity are collapsed into the smallest one of them,
+    so that every list has at most one boundary above the capacity. The intervals containing budgets
+    up to the capacity are the same as without the capacity.
+
     @param weights list of positive numbers
+    @param capacity optional total budget, above which the sums are collapsed
     @return list of lists of partial sums
 '''
-def compute_backward_sums(weights):
-    sum_lists = make_sum_combinations(weights)
+def compute_backward_sums(weights, capacity=None):
+    sum_lists = make_sum_combinations(weights, capacity)
 
-    del sum_lists[0]
-    for i in range(len(sum_lists)):
-        # around zero there is no change in the maximum total benefit
-        sum_lists[i].remove(0)
+    # the sums are sorted and the weights are positive, so the empty sum zero always comes first;
+    # around zero there is no change in the maximum total benefit
+    return [[-float('inf')] + sums[1:] + [float('inf')] for sums in sum_lists[1:]]
 
-        sum_lists[i].sort()
-        sum_lists[i].insert(0, -float('inf'))
-        sum_lists[i].append(float('inf'))
+'''
+    Computes the same lists of backward sums as compute_backward_sums on the reversed weights, but lazily:
+    the list of every step is only computed when it is asked for, from the last step to the first, and only
+    the current one is kept.
 
-    return sum_lists
+    @param sums optional sorted list of the sums after the last step, starting with zero, to continue from
+    @return generator of pairs of a step and its list of backward sums with the infinities
+'''
+def iterate_backward_sums(weights, capacity=None, sums=None):
+    sums = [0] if sums is None else list(sums)
+    seen_sums = set(sums)
+    for step in range(len(weights))[::-1]:
+        sums = add_to_sums(sums, weights[step], capacity, seen_sums)
+        logging.debug('Backward sums at step %s: %s', step, sums)
+        yield step, [-float('inf')] + sums[1:] + [float('inf')]
 
 '''
     Finds intervals from the second list, which contain at least one point from the first list.
@@ -61,53 +126,358 @@ def compute_backward_sums(weights):
     over 1-D scalars. In the second list, every two consective numbers a, b form an interval that fits
     all scalars x with a <= x < b.
 
-    Each interval is output as a pair (a, b). This function outputs a list of such pairs.
+    Each interval is output as a pair (a, b). This function outputs a list of such pairs, sorted by their
+    lower boundaries.
+
+    The scalars at some step are the budgets we might have left at that step, and they are kept in a set.
+    Since every list of intervals is sorted, the interval containing a scalar is found by binary search,
+    and the found intervals are collected by their index in a set.
 
-    @param accumulated_forward The scalars
     @param accumulated_backward The intervals
+    @param weights The weights, whose partial sums are subtracted from the capacity to get the scalars
+    @param capacity The total budget, that is the only scalar at the first step
+    @param workers optional number of worker processes, that extract the intervals of integer instances in parallel
     @return list of pairs defining non-empty intervals from the second list
 '''
-def compute_relevant_intervals(accumulated_backward, weights, capacity):
+def compute_relevant_intervals(accumulated_backward, weights, capacity, workers=None):
     all_intervals = []
-    current_accumulated = [capacity]
-    logging.debug(f'There are {len(weights)-1} numbers to make sums of')
+    for step, lower_indices in enumerate(compute_relevant_indices(accumulated_backward, weights, [capacity], workers)):
+        boundaries = accumulated_backward[step]
+        all_intervals.append([(boundaries[i], boundaries[i+1]) for i in lower_indices])
+    return all_intervals
+
+'''
+    Finds the relevant intervals like compute_relevant_intervals does, but for several capacities at once,
+    and gives every interval by the index of its lower boundary.
+
+    @return list of sorted lists of indices, one for every step
+'''
+def compute_relevant_indices(accumulated_backward, weights, capacities, workers=None):
+    if workers is not None and workers > 1 and len(weights) >= MIN_PARALLEL_STEPS \
+            and is_integral(weights, 0) and all(isinstance(capacity, int) for capacity in capacities) \
+            and sum(weights) + max(capacities) < 2**63:
+        return compute_relevant_indices_parallel(accumulated_backward, weights, capacities, workers)
+    all_indices = []
+    leftovers = make_leftovers(weights, capacities)
     for step in range(len(weights)):
         if step > 0:
-            weight = weights[step-1]
-            previous_length = len(current_accumulated)
-            for old_leftover in current_accumulated[:previous_length]:
-                new_leftover = old_leftover - weight
-                if new_leftover >= 0 and new_leftover not in current_accumulated:
-                    current_accumulated.append(new_leftover)
-            logging.debug(f'Computed {len(current_accumulated)} sums up to {step}th number')
-            logging.debug(f'The capacity is {capacity}')
-            logging.debug(f'The sums are\n{current_accumulated}')
-        intervals = []
-        for leftover_capacity in current_accumulated:
-            for (lower, upper) in zip(accumulated_backward[step][:-1], accumulated_backward[step][1:]):
-                if lower <= leftover_capacity < upper:
-                    if (lower, upper) not in intervals:
-                        intervals.append((lower, upper))
-        all_intervals.append(intervals)
-    return all_intervals
+            leftovers = advance_leftovers(leftovers, weights[step-1])
+        all_indices.append(find_relevant_indices(accumulated_backward[step], leftovers))
+        logging.debug('Found %s relevant intervals at step %s', len(all_indices[-1]), step)
+    return all_indices
+
+# the largest capacity, up to which the leftover budgets are held in a bitset
+MAX_BITSET_CAPACITY = 1 << 24
+
+# the bits per possible relevant interval, below which unpacking a bitset with NumPy beats the string search
+MIN_DENSITY_FOR_NUMPY = 64
+
+# the bits per set bit, from which on the set bits of a bitset are read off its nonzero bytes instead of scanned
+MIN_DENSITY_FOR_SCAN = 256
+
+# matches a nonzero byte of a bitset
+NONZERO_BYTES = re.compile(rb'[^\x00]')
+
+'''
+    Gets the positions of the set bits of the given bitset from its nonzero bytes, so that a sparse bitset
+    costs one pass over its bytes in C, and then only a little for every set bit. With NumPy, the nonzero
+    bytes are found and unpacked at once, and otherwise by a regular expression and one by one.
+
+    @return list of the positions of the set bits
+'''
+def find_set_bits(bits):
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    if np is not None:
+        data = np.frombuffer(data, np.uint8)
+        byte_positions = np.flatnonzero(data)
+        unpacked = np.unpackbits(data[byte_positions, None], axis=1, bitorder='little').view(bool)
+        return ((byte_positions[:, None] << 3) + np.arange(8))[unpacked].tolist()
+    positions = []
+    for match in NONZERO_BYTES.finditer(data):
+        byte, position = match[0][0], match.start() << 3
+        while byte:
+            if byte & 1:
+                positions.append(position)
+            byte >>= 1
+            position += 1
+    return positions
+
+'''
+    Makes the leftover budgets at the first step, which are the given capacities. For integer weights and
+    capacities up to MAX_BITSET_CAPACITY, they are held in a bitset: a Python integer, whose bit b is set,
+    if b is a leftover budget. Otherwise they are held in a set.
+'''
+def make_leftovers(weights, capacities):
+    if is_integral(weights, 0) and all(isinstance(capacity, int) and 0 <= capacity <= MAX_BITSET_CAPACITY
+            for capacity in capacities):
+        leftover_bits = 0
+        for capacity in capacities:
+            leftover_bits |= 1 << capacity
+        return leftover_bits
+    return set(capacities)
+
+'''
+    Computes the leftover budgets at the next step, if the item of the given weight may be taken or not.
+    In a bitset, this shifts all leftover budgets at once, by a shift to the right and a bitwise or, and
+    the budgets below the weight fall off to the right.
+
+    @return a new bitset or set of leftover budgets
+'''
+def advance_leftovers(leftovers, weight):
+    if isinstance(leftovers, int):
+        return leftovers | leftovers >> weight
+    return leftovers.union([leftover - weight for leftover in leftovers if leftover >= weight])
+
+'''
+    Finds the intervals between the given boundaries, which contain at least one of the given leftover budgets.
+
+    In a set, the interval of every leftover budget is found by bisection. In a bitset, the set bits are
+    scanned in its binary string: from the smallest leftover budget on, the next set bit is found by a string
+    search, its interval by bisection, and the search goes on from the upper boundary of this interval, so that
+    every relevant interval costs one search, and the budgets inside an interval are skipped. With NumPy,
+    the bits can be unpacked instead, and the intervals of all set bits found by one np.searchsorted. This
+    costs an int64 for every boundary and every set bit, so it is only done, when there may be so many
+    relevant intervals, that the string search would cost more, that is when both the set bits and the
+    boundaries are dense compared to the capacity. When the set bits are sparse instead, both would cost
+    far more than the few leftover budgets, so these are read off the nonzero bytes of the bitset, and their
+    intervals are found by bisection like in a set.
+
+    @param boundaries sorted list of boundaries, starting with the negative and ending with the positive infinity
+    @param leftovers bitset or set of leftover budgets
+    @return sorted list of indices of the lower boundaries of the relevant intervals
+'''
+def find_relevant_indices(boundaries, leftovers):
+    if isinstance(leftovers, int) and leftovers.bit_count() * MIN_DENSITY_FOR_SCAN < leftovers.bit_length():
+        leftovers = find_set_bits(leftovers)
+    if not isinstance(leftovers, int):
+        return sorted({bisect_right(boundaries, leftover_capacity) - 1 for leftover_capacity in leftovers})
+
+    if np is not None and min(leftovers.bit_count(), len(boundaries)) \
+            > (leftovers.bit_length() + 8 * len(boundaries)) // MIN_DENSITY_FOR_NUMPY:
+        bits = np.frombuffer(leftovers.to_bytes((leftovers.bit_length() + 7) // 8, 'little'), np.uint8)
+        budgets = np.flatnonzero(np.unpackbits(bits, bitorder='little'))
+        finite_sums = np.array(boundaries[1:-1], dtype=np.int64)
+        indices = np.searchsorted(finite_sums, budgets, side='right')
+        # the budgets are sorted, so the indices are sorted as well, and only the first of equal ones is kept
+        return indices[np.diff(indices, prepend=-1) != 0].tolist()
+
+    # bit b is the character at position length-1-b of the binary string
+    bit_string = format(leftovers, 'b')
+    length = len(bit_string)
+    lower_indices = []
+    budget = 0
+    while budget < length:
+        position = bit_string.rfind('1', 0, length - budget)
+        if position < 0:
+            break
+        i = bisect_right(boundaries, length - 1 - position) - 1
+        lower_indices.append(i)
+        budget = boundaries[i+1]
+    return lower_indices
+
+'''
+    Computes the leftover budgets of every step like compute_relevant_indices does, but hands them out from
+    the last step to the first. The leftover budgets can only be computed from the first step on, so they are
+    kept as checkpoints at the start of every block of about the square root of the number of steps,
+    and the leftover budgets of a block are recomputed from its checkpoint, when the block is asked for.
+
+    @param leftovers optional bitset or set of leftover budgets at the first step, instead of the capacities
+    @return generator of pairs of a step and its bitset or set of leftover budgets
+'''
+def iterate_leftovers_backwards(weights, capacities, leftovers=None):
+    num_items = len(weights)
+    block_size = max(math.isqrt(num_items), 1)
+    checkpoints = []
+    if leftovers is None:
+        leftovers = make_leftovers(weights, capacities)
+    for step in range(num_items):
+        if step > 0:
+            leftovers = advance_leftovers(leftovers, weights[step-1])
+        if step % block_size == 0:
+            checkpoints.append(leftovers)
+    del leftovers
+
+    for block, start in list(enumerate(range(0, num_items, block_size)))[::-1]:
+        block_leftovers = [checkpoints.pop()]
+        for step in range(start + 1, min(start + block_size, num_items)):
+            block_leftovers.append(advance_leftovers(block_leftovers[-1], weights[step-1]))
+        while block_leftovers:
+            yield start + len(block_leftovers) - 1, block_leftovers.pop()
+
+'''
+    Pairs up the backward sums and the leftover budgets of every step, both coming from the last step
+    to the first, and finds the relevant intervals of every step.
+
+    @return generator of pairs of a step and its sorted list of relevant intervals
+'''
+def iterate_relevant_intervals(backward_levels, leftover_levels):
+    for (step, boundaries), (_, leftovers) in zip(backward_levels, leftover_levels):
+        budget_intervals = [(boundaries[i], boundaries[i+1]) for i in find_relevant_indices(boundaries, leftovers)]
+        logging.debug('Relevant intervals at step %s: %s', step, budget_intervals)
+        yield step, budget_intervals
+
+# the number of steps, from which on the relevant intervals are worth extracting in parallel
+MIN_PARALLEL_STEPS = 64
+
+'''
+    Finds the relevant intervals like compute_relevant_indices, but splits the steps into chunks and extracts
+    the intervals of every chunk in a pool of worker processes. It requires integer weights and capacities.
+
+    The leftover budgets at the first step of every chunk are computed here, with the same bitsets as
+    compute_relevant_indices, and every worker continues from them through its chunk. Nothing big is pickled:
+    the finite backward sums of all steps, the leftover budgets at the chunk starts, and one flag for every
+    interval, which the workers set for the relevant ones, all lie in shared memory as flat arrays, and only
+    offsets into them are sent to the workers. A bitset lies there as the bytes of its integer, and a set
+    as an array of 64-bit integers.
+
+    @param workers the number of worker processes
+    @return list of sorted lists of indices, one for every step
+'''
+def compute_relevant_indices_parallel(accumulated_backward, weights, capacities, workers):
+    num_steps = len(weights)
+    chunk_size = -(-num_steps // (4 * workers))
+    chunk_starts = list(range(0, num_steps, chunk_size))
+
+    # the finite sums of a step lie between the infinite sentinels; every step has one interval more than sums
+    sum_offsets = [0]
+    for boundaries in accumulated_backward:
+        sum_offsets.append(sum_offsets[-1] + len(boundaries) - 2)
+    flag_offsets = [sum_offsets[step] + step for step in range(num_steps + 1)]
+
+    leftover_offsets = [0]
+    leftover_chunks = []
+    leftovers = make_leftovers(weights, capacities)
+    bitset = isinstance(leftovers, int)
+    for step in range(chunk_starts[-1] + 1):
+        if step > 0:
+            leftovers = advance_leftovers(leftovers, weights[step-1])
+        if step % chunk_size == 0:
+            if bitset:
+                leftover_chunks.append(leftovers.to_bytes((leftovers.bit_length() + 7) // 8, 'little'))
+            else:
+                leftover_chunks.append(array('q', leftovers).tobytes())
+            leftover_offsets.append(leftover_offsets[-1] + len(leftover_chunks[-1]))
+    del leftovers
+
+    sums_memory = shared_memory.SharedMemory(create=True, size=8 * max(sum_offsets[-1], 1))
+    leftovers_memory = shared_memory.SharedMemory(create=True, size=max(leftover_offsets[-1], 1))
+    flags_memory = shared_memory.SharedMemory(create=True, size=max(flag_offsets[-1], 1))
+    try:
+        with sums_memory.buf.cast('q') as sums:
+            for step, boundaries in enumerate(accumulated_backward):
+                sums[sum_offsets[step]:sum_offsets[step+1]] = array('q', boundaries[1:-1])
+        for chunk, leftover_bytes in enumerate(leftover_chunks):
+            leftovers_memory.buf[leftover_offsets[chunk]:leftover_offsets[chunk+1]] = leftover_bytes
+        del leftover_chunks
+        flags_memory.buf[:flag_offsets[-1]] = bytes(flag_offsets[-1])
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for chunk, start in enumerate(chunk_starts):
+                stop = min(start + chunk_size, num_steps)
+                futures.append(executor.submit(extract_relevant_chunk, sums_memory.name, leftovers_memory.name,
+                    flags_memory.name, sum_offsets[start:stop+1], flag_offsets[start:stop+1],
+                    leftover_offsets[chunk:chunk+2], bitset, weights[start:stop]))
+            for future in futures:
+                future.result()
+
+        flags = bytes(flags_memory.buf[:flag_offsets[-1]])
+        all_indices = [[i for i, flag in enumerate(flags[flag_offsets[step]:flag_offsets[step+1]]) if flag]
+            for step in range(num_steps)]
+    finally:
+        for memory in (sums_memory, leftovers_memory, flags_memory):
+            memory.close()
+            memory.unlink()
+    return all_indices
+
+'''
+    Extracts the relevant intervals of one chunk of steps for compute_relevant_indices_parallel, in a worker
+    process. The given offsets locate the chunk's finite sums, flags and leftover budgets in the shared memory.
+    The leftover budgets are advanced and the relevant intervals found like in compute_relevant_indices, and
+    an interval is flagged by the index of its lower boundary among all boundaries including the negative
+    infinity.
+
+    @param bitset whether the leftover budgets are the bytes of a bitset, or an array of them
+'''
+def extract_relevant_chunk(sums_name, leftovers_name, flags_name, sum_offsets, flag_offsets, leftover_offsets,
+        bitset, weights):
+    memories = [shared_memory.SharedMemory(name=name) for name in (sums_name, leftovers_name, flags_name)]
+    leftover_bytes = bytes(memories[1].buf[leftover_offsets[0]:leftover_offsets[1]])
+    if bitset:
+        leftovers = int.from_bytes(leftover_bytes, 'little')
+    else:
+        leftovers = set(array('q', leftover_bytes))
+    del leftover_bytes
+    with memories[0].buf.cast('q') as sums:
+        flags = memories[2].buf
+        for step in range(len(weights)):
+            if step > 0:
+                leftovers = advance_leftovers(leftovers, weights[step-1])
+            boundaries = [-float('inf')] + sums[sum_offsets[step]:sum_offsets[step+1]].tolist() + [float('inf')]
+            flag_offset = flag_offsets[step]
+            for i in find_relevant_indices(boundaries, leftovers):
+                flags[flag_offset + i] = 1
+        del flags
+    for memory in memories:
+        memory.close()
+
+'''
+    Maximum total profits of the relevant budget intervals at one step.
+
+    The intervals are stored as parallel lists of lower boundaries, upper boundaries and total profits.
+    They have to be added in ascending order of their lower boundaries, as they are returned by
+    compute_relevant_intervals, so that the lists stay sorted and can be searched by bisection.
+'''
+class ProfitTable:
+    __slots__ = ('lowers', 'uppers', 'profits')
+
+    def __init__(self):
+        self.lowers = []
+        self.uppers = []
+        self.profits = []
+
+    def add(self, lower, upper, total_profit):
+        self.lowers.append(lower)
+        self.uppers.append(upper)
+        self.profits.append(total_profit)
+
+    def intervals(self):
+        return list(zip(self.lowers, self.uppers))
+
+    '''
+        Makes a copy of the table, whose columns are compact arrays, see make_column. A column with an infinite
+        boundary becomes an array of doubles, so the boundaries must be exact as doubles.
+    '''
+    def compacted(self):
+        table = ProfitTable()
+        table.lowers = make_column(self.lowers)
+        table.uppers = make_column(self.uppers)
+        table.profits = make_column(self.profits)
+        return table
+
+    def __len__(self): return len(self.lowers)
+
+    def __str__(self):
+        return str(dict(zip(self.intervals(), self.profits)))
 
 '''
-    Gets the value of the indicated dictionary inside 'solution' of the key, that is an interval which
+    Gets the total profit stored in the indicated table inside 'solution' for the interval, that
     completely covers the given interval (lower, upper).
 
-    'solution' is a list of dictionaries where each dictionary maps pairs of numbers, that is intervals,
+    'solution' is a list of profit tables where each table maps pairs of numbers, that is intervals,
     to some sums of the profits. Now, we are given an interval and want to find the value of this interval
-    but the dictionary might not contain this exact interval, so we look for one that completely covers
-    this interval.
+    but the table might not contain this exact interval, so we look for one that completely covers
+    this interval. The intervals of a table are disjoint and sorted, so the only candidate is the last one
+    starting at or below the given lower boundary, up to some epsilon.
 
-    We use the dictionary at 'step' if it exists. It might be that 'step' shoots over the length of the list
+    We use the table at 'step' if it exists. It might be that 'step' shoots over the length of the list
     in which case, we return 0.
 
     This function is undefined if the given interval is not completely contained in some interval of the
-    targeted dictionary.
+    targeted table.
 
-    @param solution List of dictionary to query
-    @param step The index of the dictionary to query
+    @param solution List of profit tables to query
+    @param step The index of the table to query
     @param lower The lower boundary of the interval, whose sum of profits we want to know
     @param upper The upper boundary of the interval, whose sum of profits we want to know
 '''
@@ -115,20 +485,99 @@ def get_total_profit(solution, step, lower, upper):
     if step >= len(solution): return .0
 
     epsilon = 1e-8
-    for (l, u), total_profit in solution[step].items():
-        if -epsilon + l <= lower < upper <= u + epsilon:
-            logging.debug(f'At step {step}, queried interval ({lower}, {upper}); got total profit of interval ({l}, {u})')
-            return total_profit
-    logging.debug(f'At step {step}, queried interval ({lower}, {upper}) is not contained in any available interval')
-    logging.debug(solution[step].keys())
+    table = solution[step]
+    i = bisect_right(table.lowers, lower + epsilon) - 1
+    if i >= 0 and lower < upper <= table.uppers[i] + epsilon:
+        logging.debug('At step %s, queried interval (%s, %s); got total profit of interval (%s, %s)',
+            step, lower, upper, table.lowers[i], table.uppers[i])
+        return table.profits[i]
+    logging.debug('At step %s, queried interval (%s, %s) is not contained in any available interval', step, lower, upper)
+    logging.debug('%s', table.intervals())
     return None
 
+'''
+    Computes the maximum total profit for every relevant budget interval at every step, one step after
+    the other, as the relevant intervals of the steps come in, from the last step to the first. The interval
+    at some step is looked up at the next step once as it is, when skipping the item, and once shifted down
+    by the item's weight, when taking it. Only the table of the previous step is needed for the next one.
+
+    @param interval_levels iterable of pairs of a step and its sorted list of relevant intervals
+    @param weights The clean weights of the items, sorted ascendingly
+    @param profits The profits of the items
+    @param next_table optional profit table of the step after the last one, if the items continue after them
+    @return generator of pairs of a step and its profit table
+'''
+def iterate_profit_tables(interval_levels, weights, profits, next_table=None):
+    for step, budget_intervals in interval_levels:
+        next_tables = [next_table] if next_table is not None else []
+        table = ProfitTable()
+        weight = weights[step]
+        for lower_budget, upper_budget in budget_intervals:
+            max_total_profit = get_total_profit(next_tables, 0, lower_budget, upper_budget)
+
+            if weight <= lower_budget:
+                profit = profits[step]
+                one_total_profit = profit \
+                    + get_total_profit(next_tables, 0, lower_budget-weight, upper_budget-weight)
+                if one_total_profit > max_total_profit:
+                    max_total_profit = one_total_profit
+
+            table.add(lower_budget, upper_budget, max_total_profit)
+        yield step, table
+        next_table = table
+
+def is_integral(weights, capacity):
+    return isinstance(capacity, int) and all(isinstance(weight, int) for weight in weights)
+
+'''
+    Computes the same profit tables as iterate_profit_tables, but handles all intervals of one step
+    at once with NumPy. The lower boundaries of a step are held in an int64 array, where the infinite boundary
+    is replaced by a number far below any budget, and the profits in a float64 array. Both lookups at the next
+    step are then a single np.searchsorted each, and the better choice is taken with np.maximum. The lower
+    boundaries and profits of the previous step are kept as NumPy arrays.
+
+    Only the lower boundaries are searched, so this relies on the containment property instead of checking it.
+    It requires integer weights, so that no epsilon is needed.
+
+    @param interval_levels iterable of pairs of a step and its sorted list of relevant intervals
+    @param weights The clean integer weights of the items, sorted ascendingly
+    @return generator of pairs of a step and its profit table
+'''
+def iterate_profit_tables_numpy(interval_levels, weights, profits, next_table=None):
+    minus_infinity = -(sum(weights) + 1)
+    next_lowers = np.array([minus_infinity], dtype=np.int64)
+    next_profits = np.zeros(1, dtype=np.float64)
+    if next_table is not None:
+        next_lowers = np.array([lower if lower != -float('inf') else minus_infinity for lower in next_table.lowers],
+            dtype=np.int64)
+        next_profits = np.array(next_table.profits, dtype=np.float64)
+    for step, intervals in interval_levels:
+        lowers = np.array([lower if lower != -float('inf') else minus_infinity for lower, _ in intervals],
+            dtype=np.int64)
+
+        # the total profit, if we don't take this item
+        skip_profits = next_profits[np.searchsorted(next_lowers, lowers, side='right') - 1]
+
+        # the total profit, if we take this item; the infinite lower boundary is never large enough
+        weight = weights[step]
+        take_profits = profits[step] \
+            + next_profits[np.searchsorted(next_lowers, lowers - weight, side='right') - 1]
+        max_profits = np.where(lowers >= weight, np.maximum(skip_profits, take_profits), skip_profits)
+
+        table = ProfitTable()
+        table.lowers = [lower for lower, _ in intervals]
+        table.uppers = [upper for _, upper in intervals]
+        table.profits = max_profits.tolist()
+        yield step, table
+        next_lowers, next_profits = lowers, max_profits
+
 class Item:
-    def __init__(self, index, weight, profit):
+    __slots__ = ('id', 'weight', 'clean_weight', 'profit')
+
+    def __init__(self, index, weight, profit, clean_weight=None):
         self.id = index
         self.weight = weight
-        self.clean_weight = weight
-        self.sparse_weight = None
+        self.clean_weight = weight if clean_weight is None else clean_weight
         self.profit = profit
 
     def __str__(self):
@@ -141,185 +590,1078 @@ class Item:
             logging.info('Item {:4d}: {}'.format(item.id, item))
         logging.info('')
 
+'''
+    Makes a compact column out of the given numbers. Integers are stored as 64-bit integers and
+    floats as doubles, in an array from the array module. Integers too large for 64 bits are kept in a list.
+    Arrays and typed memory views are already compact and are used as they are.
+'''
+def make_column(numbers):
+    if isinstance(numbers, (array, memoryview)): return numbers
+    try: return array('q', numbers)
+    except OverflowError: return list(numbers)
+    except TypeError: return array('d', numbers)
+
+'''
+    The items of a Knapsack instance, stored column by column: the ids, the real weights, the clean weights
+    and the profits each in one compact array. Subsets and orderings of the items are handled as lists
+    of indices into these columns, so that no item is ever copied or deleted.
+
+    Indexing or iterating the table gives Item objects, which are created on the fly for logging and reporting.
+'''
+class ItemTable:
+    def __init__(self, ids, weights, profits):
+        self.ids = make_column(ids)
+        self.weights = make_column(weights)
+        self.clean_weights = self.weights
+        self.profits = make_column(profits)
+
+    def from_items(items):
+        if isinstance(items, ItemTable): return items
+        return ItemTable([item.id for item in items], [item.weight for item in items],
+            [item.profit for item in items])
+
+    def __len__(self): return len(self.ids)
+
+    def __getitem__(self, i):
+        return Item(self.ids[i], self.weights[i], self.profits[i], self.clean_weights[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def select(self, indices):
+        return [self[i] for i in indices]
+
+# comment lines and blank lines of a .kp file
+IGNORED_LINES = re.compile(rb'^(?:c[^\n]*|[ \t\r\f\v]*)(?:\n|$)', re.M)
+
+# a line with a single token, which lacks either the weight or the profit, between two newlines; the token is
+# matched in a lookahead and then taken by the backreference, so that it is never backtracked into
+SHORT_LINE = re.compile(rb'\n[^\S\n]*(?=(\S+))\1[^\S\n]*\n')
+
 def parse_knapsack(file):
-    capacity = None
-    knapsack_items = []
-    index = 1
-    for line in file:
-        info = line.split(' ')
-        if info[0] == 'c':
-            continue
-        if info[0] == 't':
-            try: capacity = int(info[1])
-            except: capacity = float(info[1])
-        else:
-            try: weight = int(info[0])
-            except: weight = float(info[0])
-            try: profit = int(info[1])
-            except: profit = float(info[1])
-            item = Item(index, weight, profit)
-            knapsack_items.append(item)
-        index += 1
-    if capacity is None: return None
-    return capacity, knapsack_items
-
-def sparse_number(dense, base):
-    sparse = dict()
-    i = 0
-    smaller = dense
-
-    # preprocess the number, so we also include the digits after the comma
-    after_comma = smaller - int(smaller)
-    while after_comma > 0:
-        i -= 1
-        smaller *= base
-        after_comma = smaller - int(smaller)
-
-    smaller = int(smaller)
-    while smaller > 0:
-        remain = smaller % base
-        if remain > 0:
-            sparse[i] = remain
-        smaller = int(smaller / base)
-        i += 1
-    return sparse
-
-def dense_number(sparse, base):
-    dense = 0
-    for i, digit in sparse.items():
-        dense += digit * (base**i)
-    return dense
-
-def increment(sparse, exponent, base):
-    if exponent not in sparse:
-        sparse[exponent] = 1
-    elif sparse[exponent] < base - 1:
-        sparse[exponent] += 1
-    else:
-        del sparse[exponent]
-        increment(sparse, exponent + 1, base)
+    data = file.buffer.read() if hasattr(file, 'buffer') else file.read()
+    if isinstance(data, str):
+        data = data.encode()
+    return parse_knapsack_bytes(data)
+
+def parse_number(token):
+    return float(token) if is_float_token(token) else int(token)
+
+def is_float_token(token):
+    return any(c in token for c in b'.eEnN')
+
+'''
+    Makes a column out of number tokens. The whole column is either integers or floats, which is decided
+    once by looking for a decimal point, an exponent or a nan/inf anywhere in the joined tokens.
+'''
+def parse_column(tokens):
+    if is_float_token(b' '.join(tokens)):
+        return array('d', map(float, tokens))
+    try: return array('q', map(int, tokens))
+    except OverflowError: return list(map(int, tokens))
+
+'''
+    Parses a Knapsack instance in the .kp format from the given bytes all at once.
+
+    Comment lines start with c, the capacity line starts with t, and every other line holds a weight and
+    a profit. The items get the ids they always had: every line except the comment lines counts, starting at 1.
+    Malformed numbers and lines with a single token raise a ValueError.
 
-def pop(key, dictionary, default=0):
-    if key not in dictionary:
-        return default
+    @param data The contents of a .kp file, as bytes or any buffer like a memory mapping
+    @return pair of capacity and item table, or None if there is no capacity line
+'''
+def parse_knapsack_bytes(data):
+    # drop the comment and blank lines, so that every remaining line has one pair of tokens
+    data = IGNORED_LINES.sub(b'', data)
+    num_lines = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+    tokens = data.split()
+    # the tokens can only be paired up in order, if no line is short, because then none is too long either
+    if len(tokens) == 2 * num_lines and SHORT_LINE.search(b'\n' + data + b'\n') is None:
+        firsts, seconds = tokens[0::2], tokens[1::2]
     else:
-        value = dictionary[key]
-        del dictionary[key]
-        return value
+        # some lines have more than two tokens; the rest of these lines is ignored
+        lines = [line.split()[:2] for line in data.splitlines()]
+        for line in lines:
+            if len(line) < 2:
+                raise ValueError(f'The line {b" ".join(line).decode(errors="replace")!r} lacks a weight or a profit')
+        firsts, seconds = [line[0] for line in lines], [line[1] for line in lines]
+
+    capacity_positions = [i for i, token in enumerate(firsts) if token == b't']
+    if not capacity_positions: return None
+    capacity = parse_number(seconds[capacity_positions[-1]])
+
+    # the ids run from 1 over all lines, skipping the capacity lines
+    ids = array('q')
+    start = 0
+    for position in capacity_positions + [len(firsts)]:
+        ids.extend(range(start+1, position+1))
+        start = position + 1
+    for position in capacity_positions[::-1]:
+        del firsts[position]
+        del seconds[position]
+    return capacity, ItemTable(ids, parse_column(firsts), parse_column(seconds))
 
-def solve_knapsack(knapsack_problem, modulo=1, removable_exponents=[]):
+KPB_MAGIC = b'KPB1'
+KPB_HEADER = struct.Struct('=4s4cQ8sQQ')
+
+def sidecar_path(filepath):
+    return path.splitext(filepath)[0] + '.kpb'
+
+'''
+    Writes the parsed instance into a binary sidecar file next to the .kp file. The sidecar has a header
+    with the column types, the number of items, the capacity and the size and modification time of the .kp file,
+    followed by the packed id, weight and profit columns in native byte order.
+
+    The sidecar is written to a temporary file first and then moved into place, so that a concurrent reader
+    sees either the old sidecar or the complete new one. Instances with integers too large for 64 bits are
+    not cached.
+
+    @return whether the sidecar was written
+'''
+def write_sidecar(filepath, knapsack_problem):
     capacity, knapsack_items = knapsack_problem
+    columns = [knapsack_items.ids, knapsack_items.weights, knapsack_items.profits]
+    capacity_type = 'q' if isinstance(capacity, int) else 'd'
+    if not all(isinstance(column, array) for column in columns) or abs(capacity) >= 2**63:
+        logging.info(f'Not caching {filepath}, because some numbers are too large')
+        return False
+    stat = os.stat(filepath)
+    header = KPB_HEADER.pack(KPB_MAGIC,
+        *[column.typecode.encode() for column in columns], capacity_type.encode(),
+        len(knapsack_items), struct.pack('=' + capacity_type, capacity), stat.st_size, stat.st_mtime_ns)
+    temporary_path = f'{sidecar_path(filepath)}.{os.getpid()}.tmp'
+    try:
+        with open(temporary_path, 'wb') as f:
+            f.write(header)
+            for column in columns:
+                column.tofile(f)
+        os.replace(temporary_path, sidecar_path(filepath))
+    except OSError:
+        if path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return True
+
+'''
+    Loads the instance from the binary sidecar of the given .kp file without copying the columns: the
+    sidecar is memory-mapped and the columns are typed views into the mapping.
+
+    A sidecar, whose length does not match the columns announced in its header, is stale as well.
+
+    @return pair of capacity and item table, or None if there is no up-to-date sidecar
+'''
+def read_sidecar(filepath):
+    try:
+        with open(sidecar_path(filepath), 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapping) < KPB_HEADER.size:
+        return None
+    magic, *typecodes, num_items, packed_capacity, size, mtime = KPB_HEADER.unpack_from(mapping)
+    stat = os.stat(filepath)
+    if magic != KPB_MAGIC or (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    typecodes = [typecode.decode() for typecode in typecodes]
+    if any(typecode not in 'qd' for typecode in typecodes):
+        return None
+    column_sizes = [num_items * struct.calcsize(typecode) for typecode in typecodes[:3]]
+    if len(mapping) != KPB_HEADER.size + sum(column_sizes):
+        logging.info(f'Ignoring the sidecar of {filepath}, because its length does not match its header')
+        return None
+    capacity = struct.unpack_from('=' + typecodes[3], packed_capacity)[0]
+    view = memoryview(mapping)
+    columns = []
+    offset = KPB_HEADER.size
+    for typecode, num_bytes in zip(typecodes[:3], column_sizes):
+        columns.append(view[offset:offset+num_bytes].cast(typecode))
+        offset += num_bytes
+    return capacity, ItemTable(*columns)
+
+'''
+    Parses a Knapsack instance from a .kp file by memory-mapping it.
+
+    If caching is asked for, an up-to-date binary sidecar is loaded instead of parsing, and a missing or stale
+    one is written after parsing.
+'''
+def load_knapsack(filepath, cache=False):
+    if cache:
+        knapsack_problem = read_sidecar(filepath)
+        if knapsack_problem is not None:
+            logging.info(f'Loaded {filepath} from its binary sidecar')
+            return knapsack_problem
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            knapsack_problem = parse_knapsack_bytes(mapping)
+    if cache and knapsack_problem is not None:
+        write_sidecar(filepath, knapsack_problem)
+    return knapsack_problem
+
+'''
+    Writes the given number in the given base as a string of its digits, separated by dashes.
+    This is only used to show how the digits of the weights are removed.
+'''
+def digit_string(number, base):
+    digits = []
+    number = int(number)
+    while number > 0:
+        number, digit = divmod(number, base)
+        digits.append(str(digit))
+    return '|' + '-'.join(digits[::-1]) + '|'
 
-    for step, item in enumerate(knapsack_items):
-        item.clean_weight = item.weight
-        item.sparse_weight = None
-
-    # remove details from the weights and capacity
-    removable_exponents.sort(reverse=True)
-    half_base = int(modulo / 2) + 1
-    if modulo > 1:
-        # remove details from weights
-        for item in knapsack_items:
-            sparse_weight = sparse_number(item.weight, modulo)
-            item.sparse_weight = sparse_weight # save this sparse representation for later
-
-            # round only after deleting the most important exponent
-            if removable_exponents:
-                exponent = removable_exponents[0]
-                digit = pop(exponent, sparse_weight)
-                if digit >= half_base:
-                    increment(sparse_weight, exponent + 1, modulo)
-                for exponent in removable_exponents[1:]:
-                    digit = pop(exponent, sparse_weight)
-
-            item.clean_weight = dense_number(sparse_weight, modulo)
+'''
+    Deletes the digits at the given exponents from the given numbers written in the given base. The number is
+    rounded at the most important removed digit: if that digit is at least half the base, the digit above it
+    is incremented. The other removed digits are simply dropped.
+
+    The digit at an exponent is the integer quotient of the number by that power of the base, modulo the base,
+    so the digits are removed with integer arithmetic, on all numbers at once with NumPy if the numbers are
+    a 64-bit integer column.
+
+    @param numbers list or column of non-negative numbers
+    @param base the base, in which the digits are taken
+    @param removable_exponents list of exponents of the digits to remove
+    @return list of the numbers without these digits
+'''
+def remove_digits(numbers, base, removable_exponents):
+    exponents = sorted(set(removable_exponents), reverse=True)
+    half_base = int(base / 2) + 1
+    if np is not None and isinstance(numbers, array) and numbers.typecode == 'q' \
+            and all(exponent >= 0 for exponent in exponents) and base ** (exponents[0] + 1) < 2**62:
+        numbers = np.frombuffer(numbers, dtype=np.int64)
+        removed = np.zeros_like(numbers)
+        for exponent in exponents:
+            removed += numbers // base**exponent % base * base**exponent
+        rounded = numbers // base**exponents[0] % base >= half_base
+        return (numbers - removed + rounded * base**(exponents[0] + 1)).tolist()
+
+    clean_numbers = []
+    for number in numbers:
+        clean_number = number
+        for exponent in exponents:
+            clean_number -= number // base**exponent % base * base**exponent
+        if number // base**exponents[0] % base >= half_base:
+            clean_number += base**(exponents[0] + 1)
+        clean_numbers.append(clean_number)
+    return clean_numbers
+
+'''
+    Divides the given numbers by the given scale and rounds them to the nearest integers. Positive numbers stay
+    positive, so that no item becomes free to take.
+
+    @param numbers list or column of non-negative numbers
+    @param scale the positive number, that becomes the unit
+    @return list of the scaled integers
+'''
+def scale_numbers(numbers, scale):
+    if np is not None and isinstance(numbers, array):
+        numbers = np.frombuffer(numbers, dtype=np.int64 if numbers.typecode == 'q' else np.float64)
+        return np.maximum(np.rint(numbers / scale), numbers > 0).astype(np.int64).tolist()
+    return [max(round(number / scale), 1 if number > 0 else 0) for number in numbers]
+
+'''
+    Sets the clean weights of the given items. Without a modulo or a scale, these are the real weights.
+    With a modulo, every weight is written in the modulo as base, and the digits at the removable exponents
+    are deleted, rounding at the most important one. With a scale, every weight is divided by the scale
+    and rounded to an integer.
+'''
+def clean_item_weights(knapsack_items, modulo=1, removable_exponents=[], scale=1):
+    knapsack_items.clean_weights = knapsack_items.weights
+    if modulo > 1 and removable_exponents:
+        knapsack_items.clean_weights = make_column(remove_digits(knapsack_items.weights, modulo, removable_exponents))
+    if scale != 1:
+        knapsack_items.clean_weights = make_column(scale_numbers(knapsack_items.clean_weights, scale))
+
+'''
+    Orders the items for the interval computations: the zero-profit items are left out, the zero-weight items
+    are laid aside, and the rest are sorted ascendingly by their clean weights.
+
+    @return the indices of the sorted items, and the indices of the zero-weight items
+'''
+def order_items(knapsack_items):
+    all_weights = knapsack_items.clean_weights
+    all_profits = knapsack_items.profits
 
     # remove the zero-profit items
-    zero_profit = [i for i in range(len(knapsack_items)) if knapsack_items[i].profit == 0]
-    for i in sorted(zero_profit, reverse=True):
-        # it is important to have the indices sorted, otherwise the wrong items will be removed
-        logging.debug(f'Removing the zero-profit {i}th item with {knapsack_items[i]}')
-        del knapsack_items[i]
+    order = [i for i in range(len(knapsack_items)) if all_profits[i] != 0]
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for i in range(len(knapsack_items)):
+            if all_profits[i] == 0:
+                logging.debug('Removing the zero-profit %dth item with %s', i, knapsack_items[i])
 
     # lay aside the zero-weight items, and later in every case include them in the knapsack
-    zero_weight = [i for i in range(len(knapsack_items)) if knapsack_items[i].clean_weight == 0]
-    cheap_items = []
-    for i in sorted(zero_weight, reverse=True):
-        # it is important to have the indices sorted, otherwise the wrong items will be looked at
-        cheap = knapsack_items[i]
-        logging.debug(f'Laying aside zero-weight {i}th item with {cheap}')
-        del knapsack_items[i]
-        cheap_items.append(cheap)
+    cheap_order = [i for i in order if all_weights[i] == 0]
+    for i in cheap_order:
+        logging.debug('Laying aside zero-weight %sth item with %s', i, knapsack_items[i])
+    order = [i for i in order if all_weights[i] != 0]
 
     # sort the weights ascendingly, otherwise the intervals will not be computed correctly
-    knapsack_items.sort(key=lambda item: item.clean_weight)
-
-    logging.info(f'The Knapsack has total capacity {capacity}, and the following {len(knapsack_items)} items are available:')
-    Item.show_all(knapsack_items)
-
-    # sum up all combinations of the first so-and-so-many weights
-    weights = [item.clean_weight for item in knapsack_items]
-
-    if modulo > 1:
-        for item in knapsack_items:
-            digits = item.sparse_weight
-            strings_list = [' ']*16
-            right = min(digits.keys())
-            left = max(digits.keys())
-            for i in range(right, left+1):
-                digit = digits[i] if i in digits else 0
-                strings_list[i] = str(digit)
-            number_string = '-'.join(strings_list[::-1])
-            number_string = '|' + number_string + '|'
-            logging.info('Item {:4d}: {}'.format(item.id, digits))
-            logging.info('Item {:4d}: {}'.format(item.id, number_string))
-            logging.info('')
+    order.sort(key=all_weights.__getitem__)
+    return order, cheap_order
+
+'''
+    Finds the items, that can never be in an optimal solution because together with the items dominating them,
+    they are too heavy. An item dominates another one, if it is not heavier and not less profitable, where
+    ties are broken by the order of the items sorted by weight and then by descending profit.
 
-    # sum up all combinations of the last so-and-so-many weights
-    # two subsequent weights form an interval
-    accumulated_backward_sums = compute_backward_sums(weights[::-1])[::-1]
-    logging.info('The accumulated backward sums are')
-    for step, sums_list in enumerate(accumulated_backward_sums):
-        item = knapsack_items[step]
-        logging.info(f'Item {item.id}: {sums_list}')
-    logging.info('')
-
-    # determine all intervals, which contain at least one forward sum
-    # these are the relevant intervals, for which we will later compute maximum total benefits
-    budget_intervals_per_step = compute_relevant_intervals(accumulated_backward_sums, weights, capacity)
-    logging.debug(f'The non-empty intervals are')
-    for step, budget_intervals in enumerate(budget_intervals_per_step):
-        item = knapsack_items[step]
-        logging.debug(f'Item {item.id}: {budget_intervals}')
-    logging.debug('')
+    There is an optimal solution, which together with any item always contains all the items dominating it,
+    because otherwise, the item could be swapped with a missing dominating one. So an item can be removed,
+    if its weight together with the weights of all its dominating items exceeds the capacity.
 
-    # compute maximum total benefits for every pair of item index and relevant interval
-    num_items = len(knapsack_items)
-    solution = [dict() for _ in range(num_items)]
-    profits = [item.profit for item in knapsack_items]
+    @return set of positions of the removable items
+'''
+def find_dominated_items(weights, profits, positions, capacity):
+    positions = sorted(positions, key=lambda j: (weights[j], -profits[j]))
+    negative_profits = sorted({-profits[j] for j in positions})
+
+    # a Fenwick tree over the profits in descending order, summing the weights of the items seen so far
+    tree = [0] * (len(negative_profits) + 1)
+    dominated = set()
+    for j in positions:
+        rank = bisect_right(negative_profits, -profits[j])
+        dominating_weight = 0
+        r = rank
+        while r > 0:
+            dominating_weight += tree[r]
+            r -= r & -r
+        if dominating_weight + weights[j] > capacity:
+            dominated.add(j)
+        r = rank
+        while r < len(tree):
+            tree[r] += weights[j]
+            r += r & -r
+    return dominated
+
+'''
+    Fixes items in or out of the Knapsack by upper bounds from the linear relaxation (Dantzig bound).
+
+    The items are sorted by their profit per weight, and the greedy solution takes them until the break item,
+    which does not fit anymore, and then every later item, which still fits; its total profit is a lower bound.
+    If the upper bound of the relaxation, where some greedy item is left out, is below this lower bound,
+    every optimal solution takes this item. If the upper bound, where some other item is taken, is below it,
+    no optimal solution takes this item. The items not fixed like this form the core of the problem.
+
+    A lower bound known from elsewhere, such as the profit of an earlier solution, can be given as well.
+
+    @return positions of the items fixed in, and positions of the items fixed out
+'''
+def fix_items_by_bounds(weights, profits, positions, capacity, lower_bound=0):
+    positions = sorted(positions, key=lambda j: profits[j] / weights[j], reverse=True)
+    num_items = len(positions)
+    prefix_weights = [0]
+    prefix_profits = [0]
+    for j in positions:
+        prefix_weights.append(prefix_weights[-1] + weights[j])
+        prefix_profits.append(prefix_profits[-1] + profits[j])
+    num_greedy = bisect_right(prefix_weights, capacity) - 1
+    if num_greedy == num_items:
+        # all items fit together
+        return list(positions), []
+
+    greedy_profit = prefix_profits[num_greedy]
+    leftover = capacity - prefix_weights[num_greedy]
+    for j in positions[num_greedy+1:]:
+        if weights[j] <= leftover:
+            greedy_profit += profits[j]
+            leftover -= weights[j]
+    lower_bound = max(lower_bound, greedy_profit)
+
+    # with integer weights and profits, the bounds are rounded down exactly in integers
+    integral = is_integral([weights[j] for j in positions], capacity) \
+        and all(isinstance(profits[j], int) for j in positions)
+    def is_below_lower_bound(upper_bound):
+        if integral:
+            return upper_bound < lower_bound
+        return upper_bound + 1e-9 * max(1, abs(upper_bound)) < lower_bound
+
+    def relaxation(k, budget, fractional):
+        # the first k items are taken, and the rest of the budget is filled with a fraction of another item
+        upper_bound = prefix_profits[k]
+        if fractional < num_items:
+            f = positions[fractional]
+            if integral:
+                upper_bound += profits[f] * budget // weights[f]
+            else:
+                upper_bound += profits[f] / weights[f] * budget
+        return upper_bound
+
+    fixed_in = []
+    fixed_out = []
+    for i, j in enumerate(positions):
+        if i < num_greedy:
+            # the upper bound without this item, which is taken by the greedy solution
+            k = bisect_right(prefix_weights, capacity + weights[j]) - 1
+            budget = capacity + weights[j] - prefix_weights[k]
+            if is_below_lower_bound(relaxation(k, budget, k) - profits[j]):
+                fixed_in.append(j)
+        else:
+            # the upper bound with this item, which is not taken by the greedy solution
+            if weights[j] > capacity:
+                fixed_out.append(j)
+                continue
+            k = bisect_right(prefix_weights, capacity - weights[j]) - 1
+            budget = capacity - weights[j] - prefix_weights[k]
+            if is_below_lower_bound(profits[j] + relaxation(k, budget, k if k != i else k+1)):
+                fixed_out.append(j)
+    return fixed_in, fixed_out
+
+'''
+    Reduces the items before the interval computations, so that fewer items reach the enumeration of the sums.
+    Items heavier than the capacity are removed, dominated items are removed, and items are fixed in or out
+    by the bounds of the linear relaxation. This is repeated, as long as some item is removed or fixed,
+    because the capacity left over by the fixed items lets the rules apply again.
+
+    All rules keep at least one optimal solution. Fixing items in subtracts their weights from the capacity,
+    which is only exact for integer weights, so with other weights no items are fixed by the bounds.
+
+    @param weights list of positive weights of the items
+    @param profits list of positive profits of the items
+    @param capacity the total budget
+    @param lower_bound optional total profit of some known solution, which makes the bounds fix more items
+    @return sorted positions of the remaining items, positions of the items fixed in, the capacity left
+        over by the items fixed in, and the number of items removed by every rule
+'''
+def reduce_items(weights, profits, capacity, lower_bound=0):
+    remaining = set(range(len(weights)))
+    fixed = []
+    counts = {'too heavy': 0, 'dominated': 0, 'fixed in': 0, 'fixed out': 0}
+    fix_by_bounds = is_integral(weights, 0)
+    while remaining:
+        too_heavy = {j for j in remaining if weights[j] > capacity}
+        remaining -= too_heavy
+        dominated = find_dominated_items(weights, profits, remaining, capacity)
+        remaining -= dominated
+        fixed_in, fixed_out = [], []
+        if fix_by_bounds:
+            fixed_in, fixed_out = fix_items_by_bounds(weights, profits, remaining, capacity, lower_bound)
+        remaining.difference_update(fixed_in, fixed_out)
+        fixed.extend(fixed_in)
+        capacity -= sum(weights[j] for j in fixed_in)
+        lower_bound -= sum(profits[j] for j in fixed_in)
+        for rule, removed in zip(counts, (too_heavy, dominated, fixed_in, fixed_out)):
+            counts[rule] += len(removed)
+        if not (too_heavy or dominated or fixed_in or fixed_out):
+            break
+    return sorted(remaining), fixed, capacity, counts
+
+'''
+    Solves the Knapsack instance by a depth-first branch-and-bound over the items sorted by profit per weight.
+    Every item is first tried as taken and then as left out, and a branch is cut off, as soon as the bound
+    of its linear relaxation (Dantzig bound) cannot beat the best solution found so far.
+
+    If a deadline is given and reached, the search stops and the best solution found so far is returned.
+
+    @param weights list of positive weights of the items
+    @param profits list of positive profits of the items
+    @param capacity the total budget
+    @param deadline optional value of time.perf_counter(), at which to stop searching
+    @return total profit and positions of the taken items, and whether the solution is known to be optimal
+'''
+def branch_and_bound(weights, profits, capacity, deadline=None):
+    positions = sorted(range(len(weights)), key=lambda j: profits[j] / weights[j], reverse=True)
+    num_items = len(positions)
+    prefix_weights = [0]
+    prefix_profits = [0]
+    for j in positions:
+        prefix_weights.append(prefix_weights[-1] + weights[j])
+        prefix_profits.append(prefix_profits[-1] + profits[j])
+    # with integer weights and profits, the bound is rounded down exactly in integers
+    integral = is_integral(weights, capacity) and all(isinstance(profits[j], int) for j in positions)
+
+    def upper_bound(k, leftover, profit):
+        # take the next items as long as they fit, and then a fraction of the next one
+        m = bisect_right(prefix_weights, prefix_weights[k] + leftover) - 1
+        bound = profit + prefix_profits[m] - prefix_profits[k]
+        if m < num_items:
+            j = positions[m]
+            residual = leftover - prefix_weights[m] + prefix_weights[k]
+            if integral:
+                bound += profits[j] * residual // weights[j]
+            else:
+                bound += profits[j] / weights[j] * residual
+        # a float bound is raised a little, so that rounding never cuts off an optimal branch
+        return bound if integral else bound + 1e-9 * max(1, abs(bound))
+
+    best_profit = 0
+    best_taking = []
+    taking = []
+    num_nodes = 0
+    stack = [(0, capacity, 0, 0, None)]
+    while stack:
+        k, leftover, profit, num_taken, taken = stack.pop()
+        del taking[num_taken:]
+        if taken is not None:
+            taking.append(taken)
+        if profit > best_profit:
+            best_profit = profit
+            best_taking = list(taking)
+
+        num_nodes += 1
+        if deadline is not None and num_nodes % 1024 == 0 and time.perf_counter() > deadline:
+            logging.warning(f'Stopped branch-and-bound after {num_nodes} nodes, because the time is up')
+            return best_profit, best_taking, False
+
+        if k == num_items or upper_bound(k, leftover, profit) <= best_profit:
+            continue
+        j = positions[k]
+        stack.append((k+1, leftover, profit, len(taking), None))
+        if weights[j] <= leftover:
+            stack.append((k+1, leftover - weights[j], profit + profits[j], len(taking), j))
+    logging.info(f'Finished branch-and-bound after {num_nodes} nodes')
+    return best_profit, best_taking, True
+
+'''
+    Solves the Knapsack instance by the classic dynamic program over all budgets from 0 to the capacity.
+    One array holds the best total profit for every budget and is updated in place for every item, from the
+    largest budget down. Whether the item is taken at a budget is recorded in one bit of a packed decision matrix
+    with a row for every item, so the memory is about n times capacity bits. The taken items are then read off
+    this matrix from the last item to the first. With NumPy, every item is one vectorized update of the array.
+
+    It requires integer weights; these and the capacity are first divided by their greatest common divisor.
+
+    @param weights list of positive integer weights of the items
+    @param profits list of positive profits of the items
+    @param capacity the total integer budget
+    @param use_numpy whether to update the profit array with NumPy
+    @return positions of the taken items
+'''
+def capacity_dp(weights, profits, capacity, use_numpy=False):
+    divisor = 0
+    for weight in weights:
+        divisor = math.gcd(divisor, weight)
+    if divisor > 1:
+        weights = [weight // divisor for weight in weights]
+        capacity //= divisor
+    num_items = len(weights)
+    row_bytes = (capacity >> 3) + 1
+
+    if use_numpy:
+        integral = all(isinstance(profit, int) for profit in profits) and sum(profits) < 2**62
+        best = np.zeros(capacity + 1, dtype=np.int64 if integral else np.float64)
+        decisions = np.zeros((num_items, row_bytes), dtype=np.uint8)
+        taking_row = np.zeros(row_bytes << 3, dtype=bool)
+        for step, (weight, profit) in enumerate(zip(weights, profits)):
+            if weight > capacity:
+                continue
+            take_profits = best[:capacity+1-weight] + profit
+            taking = take_profits > best[weight:]
+            np.copyto(best[weight:], take_profits, where=taking)
+            taking_row[:] = False
+            taking_row[weight:capacity+1] = taking
+            decisions[step] = np.packbits(taking_row, bitorder='little')
+    else:
+        best = [0] * (capacity + 1)
+        decisions = [bytearray(row_bytes) for _ in range(num_items)]
+        for step, (weight, profit) in enumerate(zip(weights, profits)):
+            row = decisions[step]
+            for budget in range(capacity, weight-1, -1):
+                take_profit = best[budget-weight] + profit
+                if take_profit > best[budget]:
+                    best[budget] = take_profit
+                    row[budget >> 3] |= 1 << (budget & 7)
+
+    taking = []
+    budget = capacity
     for step in range(num_items)[::-1]:
-        for lower_budget, upper_budget in budget_intervals_per_step[step]:
-            max_total_profit = get_total_profit(solution, step+1, lower_budget, upper_budget)
+        if decisions[step][budget >> 3] >> (budget & 7) & 1:
+            taking.append(step)
+            budget -= weights[step]
+    return taking[::-1]
 
-            weight = weights[step]
-            if weight <= lower_budget:
-                profit = profits[step]
-                one_total_profit = profit \
-                    + get_total_profit(solution, step+1, lower_budget-weight, upper_budget-weight)
-                if one_total_profit > max_total_profit:
-                    max_total_profit = one_total_profit
+'''
+    Computes all pairs of total weight and total profit of subsets of the given items, which are not dominated
+    by another pair. A pair is dominated, if another pair has at most its weight and at least its profit.
+    Like in make_sum_combinations, the items are added one after the other and every next list is a merge of the
+    previous list with the previous list shifted by the next item, but here the profits are carried alongside
+    the sums and the dominated pairs are dropped during the merge.
+
+    Every pair also carries a bit mask of the items in its subset, so that the subset can be recovered.
+
+    @param weights list of positive weights
+    @param profits list of positive profits
+    @param bound optional number, above which all sums are dropped
+    @return three lists of the weights, profits and masks of the pairs, sorted ascendingly by weight and profit
+'''
+def make_profit_combinations(weights, profits, bound=None):
+    sums, sum_profits, masks = [0], [0], [0]
+    for k, (weight, profit) in enumerate(zip(weights, profits)):
+        # the shifted pairs are sorted as well, so merging them is linear
+        num_shifted = len(sums) if bound is None else bisect_right(sums, bound - weight)
+        shifted = [(sums[i] + weight, sum_profits[i] + profit, masks[i] | 1 << k) for i in range(num_shifted)]
+        next_sums, next_profits, next_masks = [], [], []
+        i = j = 0
+        while i < len(sums) or j < num_shifted:
+            if j == num_shifted or (i < len(sums) and (sums[i], -sum_profits[i]) <= (shifted[j][0], -shifted[j][1])):
+                pair = sums[i], sum_profits[i], masks[i]
+                i += 1
+            else:
+                pair = shifted[j]
+                j += 1
+            if next_profits and pair[1] <= next_profits[-1]:
+                continue
+            next_sums.append(pair[0])
+            next_profits.append(pair[1])
+            next_masks.append(pair[2])
+        sums, sum_profits, masks = next_sums, next_profits, next_masks
+        logging.debug('Kept %d undominated pairs up to %dth item', len(sums), k+1)
+    return sums, sum_profits, masks
+
+'''
+    Solves the Knapsack instance by meeting in the middle. The items are split into two halves, and for each half,
+    all undominated pairs of total weight and total profit are enumerated. The best solution combines a pair
+    of the first half with the heaviest pair of the second half, that still fits into the leftover budget.
+    Since the pairs of the first half are sorted ascendingly by weight, these fitting pairs of the second half
+    only ever get lighter, so a single sweep with two pointers finds the best combination.
+
+    This needs no integer weights, and only about 2^(n/2) pairs for each half at most.
+
+    @param weights list of positive weights of the items
+    @param profits list of positive profits of the items
+    @param capacity the total budget
+    @return positions of the taken items
+'''
+def meet_in_the_middle(weights, profits, capacity):
+    half = len(weights) // 2
+    left_sums, left_profits, left_masks = make_profit_combinations(weights[:half], profits[:half], capacity)
+    right_sums, right_profits, right_masks = make_profit_combinations(weights[half:], profits[half:], capacity)
+    logging.info(f'Combining {len(left_sums)} with {len(right_sums)} undominated pairs')
+
+    best_profit, best_left, best_right = -1, 0, 0
+    j = len(right_sums) - 1
+    for i, left_sum in enumerate(left_sums):
+        while j >= 0 and left_sum + right_sums[j] > capacity:
+            j -= 1
+        if j < 0:
+            break
+        if left_profits[i] + right_profits[j] > best_profit:
+            best_profit, best_left, best_right = left_profits[i] + right_profits[j], i, j
+
+    taking = [k for k in range(half) if left_masks[best_left] >> k & 1]
+    taking.extend(half + k for k in range(len(weights) - half) if right_masks[best_right] >> k & 1)
+    return taking
+
+# the estimated number of subset sums, up to which the interval engine is chosen automatically
+MAX_INTERVAL_SUMS = 1000000
+
+# the number of decision bits, up to which the array engine is chosen automatically, when NumPy is used
+MAX_ARRAY_CELLS = 100000000
+
+'''
+    Estimates the number of distinct sums of subsets of the given weights up to the capacity. There are
+    at most 2^n of them, and for integer weights at most one for every multiple of their greatest common divisor.
+'''
+def estimate_subset_sums(weights, capacity):
+    estimate = 2 ** min(len(weights), 64)
+    if is_integral(weights, capacity) and weights:
+        divisor = 0
+        for weight in weights:
+            divisor = math.gcd(divisor, weight)
+        estimate = min(estimate, capacity // divisor + 1)
+    return estimate
+
+'''
+    Computes the bound of the linear relaxation of the Knapsack instance (Dantzig bound): the items are taken by
+    decreasing profit per weight as long as they fit, and then a fraction of the next one.
+'''
+def dantzig_bound(weights, profits, capacity):
+    bound = 0
+    leftover = capacity
+    for weight, profit in sorted(zip(weights, profits), key=lambda pair: -pair[1] / pair[0] if pair[0] else -math.inf):
+        if profit <= 0:
+            continue
+        if weight > leftover:
+            bound += profit * leftover / weight
+            break
+        leftover -= weight
+        bound += profit
+    return bound
+
+'''
+    Chooses the scale, by which the weights are divided for an approximate solution with the given target error.
+    Rounding a weight to the nearest multiple of the scale changes it by at most half the scale, so if about k items
+    are taken, their total weight changes by at most k times half the scale. The scale is chosen, such that this
+    is the target error times the capacity, where k is the number of items, that the greedy solution takes.
+
+    @param error the target error relative to the capacity, such as 0.01
+    @return the scale, an integer for integer weights and 1 if no scaling is needed
+'''
+def choose_scale(weights, profits, capacity, error):
+    num_taken = 0
+    leftover = capacity
+    for weight, profit in sorted(zip(weights, profits), key=lambda pair: -pair[1] / pair[0] if pair[0] else -math.inf):
+        if 0 < weight <= leftover:
+            leftover -= weight
+            num_taken += 1
+    scale = 2 * error * capacity / max(num_taken, 1)
+    if is_integral(weights, capacity):
+        scale = max(int(scale), 1)
+    return scale if scale > 0 else 1
+
+'''
+    Makes the given solution fit into the capacity with the real weights and then fills it up greedily.
+    As long as the taken items are too heavy, the one with the least profit per weight is put back.
+    Then every other item is taken by decreasing profit per weight, if it still fits.
+
+    @param knapsack_items the ItemTable of the instance
+    @param taken_indices the indices of the taken items
+    @param capacity the total budget for the real weights
+    @return the indices of the taken items after the repair
+'''
+def repair_solution(knapsack_items, taken_indices, capacity):
+    weights, profits = knapsack_items.weights, knapsack_items.profits
+    by_ratio = lambda i: profits[i] / weights[i] if weights[i] else math.inf
+    taken = sorted(set(taken_indices), key=by_ratio, reverse=True)
+    taken_weight = sum(weights[i] for i in taken)
+    while taken_weight > capacity:
+        taken_weight -= weights[taken.pop()]
+    num_repaired = len(set(taken_indices)) - len(taken)
+
+    taken_set = set(taken)
+    for i in sorted(range(len(knapsack_items)), key=by_ratio, reverse=True):
+        if i not in taken_set and profits[i] > 0 and taken_weight + weights[i] <= capacity:
+            taken.append(i)
+            taken_weight += weights[i]
+    logging.info(f'Repair put back {num_repaired} items and added {len(taken) - len(taken_set)} items')
+    return taken
+
+'''
+    Solves the Knapsack instance by the interval dynamic program like interval_dp, but never keeps the profit
+    tables of all steps at once. The steps are split into blocks of about the square root of their number,
+    and only the leftover budgets, the backward sums and the profit table at the first step of every block are
+    kept as checkpoints.
+
+    The leftover budgets at the block starts are computed from the first step on, with the same bitsets or sets
+    as in interval_dp. Then every block runs the lazy pipeline of interval_dp on its own steps, from the last
+    block to the first: its backward sums continue from the checkpoint of the next block, its leftover budgets
+    from its own checkpoint, and its profit tables from the profit table of the next block. The taken items are
+    read off block by block from the first block to the last, after running the pipeline of that block once more
+    and keeping its profit tables.
+
+    So the profit tables of about the square root of the number of steps are alive at any time, the backward
+    sums at the block starts are kept in compact arrays, and the pipeline runs twice. The levels are counted
+    in the first run only, while the seconds of every stage add up over both runs.
+
+    @param metrics optional Metrics, to which the seconds spent in every stage and the counts of every level
+        are added
+    @return positions of the taken items
+'''
+def interval_dp_checkpointed(weights, profits, capacity, prune=True, use_numpy=False, metrics=None):
+    if metrics is None:
+        metrics = Metrics()
+    stage_times = dict()
+    num_items = len(weights)
+    if num_items == 0:
+        return []
+    use_numpy = use_numpy and np is not None and is_integral(weights, capacity)
+    bound = capacity if prune else None
+    block_size = max(math.isqrt(num_items), 1)
+    block_starts = list(range(0, num_items, block_size))
+
+    # the bitsets or sets of leftover budgets at every block start
+    checkpoint_leftovers = {}
+    leftovers = make_leftovers(weights, [capacity])
+    for step in range(block_starts[-1] + 1):
+        if step > 0:
+            leftovers = advance_leftovers(leftovers, weights[step-1])
+        if step % block_size == 0:
+            checkpoint_leftovers[step] = leftovers
+    del leftovers
+
+    # the backward sums and the profit table at every block start, and the empty ones after the last step
+    checkpoint_sums = {num_items: None}
+    checkpoint_tables = {num_items: None}
+
+    # the kept profit tables are compacted, when all sums of the weights are exact as doubles
+    compact = not is_integral(weights, capacity) or sum(weights) <= 1 << 53
+
+    def iterate_block_sums(start, stop):
+        for step, boundaries in iterate_backward_sums(weights[start:stop], bound, checkpoint_sums[stop]):
+            yield step, boundaries
+        if start not in checkpoint_sums:
+            checkpoint_sums[start] = make_column([0] + boundaries[1:-1])
+
+    def iterate_block_tables(start, count):
+        stop = min(start + block_size, num_items)
+        block_weights = weights[start:stop]
+
+        # the same counters as in interval_dp, with the steps of the block moved to the steps of all items
+        counters = {
+            'backward sums': {'backward sums': lambda level: len(level[1]) - 2},
+            'leftover budgets': {'leftover budgets': lambda level: count_leftovers(level[1])},
+            'relevant intervals': {
+                'relevant intervals': lambda level: len(level[1]),
+                'lookups': lambda level: 2*len(level[1]) - bisect_left(level[1], (block_weights[level[0]],))
+            }
+        }
+        def measured_levels(levels, stage):
+            if count:
+                levels = counted_levels(levels, metrics, counters[stage], start)
+            return timed_levels(levels, stage_times, stage)
+
+        backward_levels = measured_levels(iterate_block_sums(start, stop), 'backward sums')
+        leftover_levels = measured_levels(iterate_leftovers_backwards(block_weights, None,
+            checkpoint_leftovers[start]), 'leftover budgets')
+        interval_levels = measured_levels(iterate_relevant_intervals(backward_levels, leftover_levels),
+            'relevant intervals')
+        if use_numpy:
+            table_levels = iterate_profit_tables_numpy(interval_levels, block_weights, profits[start:stop],
+                checkpoint_tables[stop])
+        else:
+            table_levels = iterate_profit_tables(interval_levels, block_weights, profits[start:stop],
+                checkpoint_tables[stop])
+        return timed_levels(table_levels, stage_times, 'profit tables')
+
+    # the profit tables at the block starts, from the last block to the first
+    for start in block_starts[::-1]:
+        for _, table in iterate_block_tables(start, True):
+            pass
+        checkpoint_tables[start] = table.compacted() if compact else table
+        del table
+    logging.info(f'Kept {len(block_starts)} checkpoints of blocks of {block_size} steps')
+
+    # collect the items required to achieve the maximum total benefit, block by block
+    taking = []
+    cur_interval = checkpoint_tables[0].intervals()[0]
+    stage_times['reconstruction'] = 0.
+    for start in block_starts:
+        next_table = checkpoint_tables[min(start + block_size, num_items)]
+        solution = [table.compacted() if compact else table
+            for _, table in iterate_block_tables(start, False)][::-1]
+        start_time = time.perf_counter()
+        if next_table is not None:
+            solution.append(next_table)
+        for step in range(len(solution) - (next_table is not None)):
+            max_total_profit = get_total_profit(solution, step, cur_interval[0], cur_interval[1])
+            zero_total_profit = get_total_profit(solution, step+1, cur_interval[0], cur_interval[1])
+            if max_total_profit <= zero_total_profit:
+                continue
+            taking.append(start + step)
+            weight = weights[start + step]
+            cur_interval = (cur_interval[0]-weight, cur_interval[1]-weight)
+        # the checkpoints of this block are not needed anymore
+        stop = min(start + block_size, num_items)
+        del solution, checkpoint_tables[start], checkpoint_sums[stop], checkpoint_leftovers[start]
+        stage_times['reconstruction'] += time.perf_counter() - start_time
+
+    # every stage of the pipeline was timed including the stages feeding it
+    for stage, feeding_stages in (('profit tables', ['relevant intervals']),
+            ('relevant intervals', ['backward sums', 'leftover budgets'])):
+        stage_times[stage] -= sum(stage_times[feeding] for feeding in feeding_stages)
+    logging.info('Seconds spent in every stage: %s', stage_times)
+    for stage, seconds in stage_times.items():
+        metrics.add_time(stage, seconds)
+    return taking
+
+'''
+    Metrics of one solve: the seconds spent in every stage, counts of every level, such as the number of
+    backward sums or relevant intervals at every step, other counters, and the peak memory of the process.
+
+    Hooks are functions, which are called with the name, the value and the step (or None) of every record
+    as soon as it is made, for tracing a solve while it runs.
+
+    While tracemalloc is tracing, the peak traced memory of every stage is recorded as well. The stages
+    measured this way must not be nested, because every one of them resets the peak.
+'''
+class Metrics:
+    def __init__(self, hooks=()):
+        self.stage_times = dict()
+        self.level_counts = dict()
+        self.counters = dict()
+        self.stage_memory = dict()
+        self.hooks = list(hooks)
+
+    def add_time(self, stage, seconds):
+        self.stage_times[stage] = self.stage_times.get(stage, 0.) + seconds
+        for hook in self.hooks: hook(stage, seconds, None)
+
+    @contextmanager
+    def stage(self, stage):
+        start_time = time.perf_counter()
+        try:
+            with self.memory(stage):
+                yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start_time)
+
+    @contextmanager
+    def memory(self, stage):
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.stage_memory[stage] = max(self.stage_memory.get(stage, 0), peak)
+
+    def count_level(self, name, step, count):
+        self.level_counts.setdefault(name, dict())[step] = count
+        for hook in self.hooks: hook(name, count, step)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+        for hook in self.hooks: hook(name, amount, None)
+
+    def to_dict(self):
+        levels = dict()
+        for name, counts in self.level_counts.items():
+            levels[name] = {
+                'total': sum(counts.values()),
+                'max': max(counts.values()),
+                'per_step': [counts[step] for step in sorted(counts)]
+            }
+        return {
+            'stage_times': self.stage_times,
+            'levels': levels,
+            'counters': self.counters,
+            'stage_memory': self.stage_memory,
+            'peak_memory': peak_memory()
+        }
 
-            solution[step][(lower_budget, upper_budget)] = max_total_profit
+'''
+    Gets the peak resident memory of this process in bytes, or None, where the resource module is missing.
+'''
+def peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+'''
+    Measures the time spent in producing the levels of the given generator, and adds it to the given stage
+    in the dictionary of stage times. The time includes the time of the generators feeding this one.
+
+    @return generator of the same levels
+'''
+def timed_levels(levels, stage_times, stage):
+    stage_times.setdefault(stage, 0.)
+    levels = iter(levels)
+    while True:
+        start_time = time.perf_counter()
+        level = next(levels, None)
+        stage_times[stage] += time.perf_counter() - start_time
+        if level is None:
+            return
+        yield level
+
+'''
+    Records counts of the levels of the given generator in the metrics: every counter is called with every
+    level, and its count is recorded under its name for the step of the level.
+
+    @param counters dictionary of names and functions, which count something in a level
+    @param offset number added to the step of every level, when the levels belong to a block of the steps
+    @return generator of the same levels
+'''
+def counted_levels(levels, metrics, counters, offset=0):
+    for level in levels:
+        for name, counter in counters.items():
+            metrics.count_level(name, offset + level[0], counter(level))
+        yield level
+
+'''
+    Counts the leftover budgets in a bitset or set of them.
+'''
+def count_leftovers(leftovers):
+    return leftovers.bit_count() if isinstance(leftovers, int) else len(leftovers)
+
+'''
+    Solves the Knapsack instance by the interval dynamic program: the backward sums make the budget intervals,
+    the forward sums select the relevant ones, the maximum total profits are computed for these from the last
+    item to the first, and the taken items are read off from the first item to the last.
+
+    The stages form a pipeline of generators, which produce the levels of the steps from the last step to the
+    first, as the profit tables ask for them. So the profit table of the last step is computed right away,
+    and the backward sums and relevant intervals of a step are dropped, as soon as its profit table is done.
+    Only when the relevant intervals are extracted by several worker processes, the backward sums and
+    intervals of all steps are computed upfront.
+
+    @param weights list of positive weights of the items, sorted ascendingly
+    @param profits list of positive profits of the items
+    @param capacity the total budget
+    @param item_ids list of the ids of the items, for logging
+    @param low_memory whether to keep only checkpoints of the levels, see interval_dp_checkpointed; the
+        checkpointed pipeline always runs in this process, so the workers are not used then
+    @param metrics optional Metrics, to which the seconds spent in every stage and the counts of every level
+        are added
+    @return positions of the taken items
+'''
+def interval_dp(weights, profits, capacity, item_ids, prune=True, use_numpy=False, workers=None, low_memory=False,
+        metrics=None):
+    if low_memory:
+        if workers is not None and workers > 1:
+            logging.info('The checkpointed intervals are computed serially, ignoring the level workers')
+        return interval_dp_checkpointed(weights, profits, capacity, prune, use_numpy, metrics)
+    if metrics is None:
+        metrics = Metrics()
+    stage_times = dict()
+    num_items = len(weights)
+
+    # two subsequent backward sums form an interval; when pruning, the sums above the capacity are
+    # collapsed, because no budget we can ever have lies above the capacity
+    bound = capacity if prune else None
+
+    # every relevant interval is looked up in the next profit table once, and once more shifted by the
+    # weight, when the item fits into it
+    interval_counters = {
+        'relevant intervals': lambda level: len(level[1]),
+        'lookups': lambda level: 2*len(level[1]) - bisect_left(level[1], (weights[level[0]],))
+    }
+    if workers is not None and workers > 1:
+        start_time = time.perf_counter()
+        accumulated_backward_sums = compute_backward_sums(weights[::-1], bound)[::-1]
+        stage_times['backward sums'] = time.perf_counter() - start_time
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug('The accumulated backward sums are')
+            for step, sums_list in enumerate(accumulated_backward_sums):
+                logging.debug('Item %s: %s', item_ids[step], sums_list)
+        for step, sums_list in enumerate(accumulated_backward_sums):
+            metrics.count_level('backward sums', step, len(sums_list) - 2)
+        budget_intervals_per_step = compute_relevant_intervals(accumulated_backward_sums, weights, capacity, workers)
+        del accumulated_backward_sums
+        stage_times['relevant intervals'] = time.perf_counter() - start_time - stage_times['backward sums']
+        interval_levels = ((step, budget_intervals_per_step.pop()) for step in range(num_items)[::-1])
+        interval_levels = counted_levels(interval_levels, metrics, interval_counters)
+    else:
+        # the intervals, which contain at least one leftover budget, are the relevant ones
+        backward_levels = counted_levels(iterate_backward_sums(weights, bound), metrics,
+            {'backward sums': lambda level: len(level[1]) - 2})
+        backward_levels = timed_levels(backward_levels, stage_times, 'backward sums')
+        leftover_levels = counted_levels(iterate_leftovers_backwards(weights, [capacity]), metrics,
+            {'leftover budgets': lambda level: count_leftovers(level[1])})
+        leftover_levels = timed_levels(leftover_levels, stage_times, 'leftover budgets')
+        interval_levels = counted_levels(iterate_relevant_intervals(backward_levels, leftover_levels), metrics,
+            interval_counters)
+        interval_levels = timed_levels(interval_levels, stage_times, 'relevant intervals')
+
+    # compute maximum total benefits for every pair of item index and relevant interval
+    if use_numpy and np is None:
+        logging.info('NumPy is not available, computing the total benefits in pure Python')
+        use_numpy = False
+    elif use_numpy and not is_integral(weights, capacity):
+        logging.info('The weights or the capacity are not integers, computing the total benefits in pure Python')
+        use_numpy = False
+    if use_numpy:
+        table_levels = iterate_profit_tables_numpy(interval_levels, weights, profits)
+    else:
+        table_levels = iterate_profit_tables(interval_levels, weights, profits)
+    solution = [None] * num_items
+    for step, table in timed_levels(table_levels, stage_times, 'profit tables'):
+        solution[step] = table
+        logging.debug('Item %s: %s', item_ids[step], table)
 
-    logging.debug('Solution table of the Knapsack instance:')
-    for step, total_profit in enumerate(solution):
-        item = knapsack_items[step]
-        logging.debug(f'Item {item.id}: {total_profit}')
-    logging.debug('')
+    # every stage of the pipeline was timed including the stages feeding it
+    if workers is None or workers <= 1:
+        for stage, feeding_stages in (('profit tables', ['relevant intervals']),
+                ('relevant intervals', ['backward sums', 'leftover budgets'])):
+            stage_times[stage] = stage_times.get(stage, 0.) - sum(stage_times.get(feeding, 0.) for feeding in feeding_stages)
 
     # collect the items required to achieve the maximum total benefit
+    start_time = time.perf_counter()
     taking = []
-    cur_interval = list(list(solution[0].keys())[0])
+    cur_interval = solution[0].intervals()[0] if num_items > 0 else None
     for step in range(num_items):
 
         # this is the total benefit, that we want to reach
@@ -334,25 +1676,658 @@ def solve_knapsack(knapsack_problem, modulo=1, removable_exponents=[]):
         taking.append(step)
         weight = weights[step]
         cur_interval = (cur_interval[0]-weight, cur_interval[1]-weight)
+    stage_times['reconstruction'] = time.perf_counter() - start_time
+    logging.info('Seconds spent in every stage: %s', stage_times)
+    for stage, seconds in stage_times.items():
+        metrics.add_time(stage, seconds)
 
-    # always take the zero-weight items
-    taken_items = [knapsack_items[step] for step in taking] + cheap_items
+    return taking
+
+def solve_knapsack(knapsack_problem, modulo=1, removable_exponents=[], prune=True, use_numpy=False, reduce=True,
+        engine='intervals', time_limit=None, report=None, approximate=None, warm_start=None, workers=None,
+        low_memory=False, metrics=None):
+    start_time = time.perf_counter()
+    if metrics is None:
+        metrics = Metrics()
+    with metrics.stage('cleaning'):
+        capacity, knapsack_items = knapsack_problem
+        knapsack_items = ItemTable.from_items(knapsack_items)
+        real_capacity = capacity
+        scale = 1
+        if approximate is not None:
+            scale = choose_scale(knapsack_items.weights, knapsack_items.profits, capacity, approximate)
+            capacity = math.floor(capacity / scale)
+            logging.info(f'Scaling the weights down by {scale} for a target error of {approximate}')
+        clean_item_weights(knapsack_items, modulo, removable_exponents, scale)
+        order, cheap_order = order_items(knapsack_items)
+    metrics.count('items', len(knapsack_items))
+    if report is None:
+        report = dict()
+    all_weights = knapsack_items.clean_weights
+    all_profits = knapsack_items.profits
+
+    # fix and remove items, which are decided without enumerating any sums
+    fixed_order = []
+    lower_bound = 0
+    if warm_start is not None and sum(all_weights[i] for i in warm_start) <= capacity:
+        # the earlier solution fits with these clean weights as well, so the optimum is at least as good;
+        # the zero-weight items are taken anyway and are not part of the reduced problem
+        cheap_indices = set(cheap_order)
+        lower_bound = sum(all_profits[i] for i in warm_start if i not in cheap_indices)
+    if reduce:
+        with metrics.stage('reduction'):
+            remaining, fixed, capacity, counts = reduce_items([all_weights[i] for i in order],
+                [all_profits[i] for i in order], capacity, lower_bound)
+            fixed_order = [order[step] for step in fixed]
+            order = [order[step] for step in remaining]
+        metrics.count('fixed items', len(fixed_order))
+        logging.info(f'Reduced the items: {counts}, leaving capacity {capacity} for the remaining items')
+
+    logging.info(f'The Knapsack has total capacity {capacity}, and the following {len(order)} items are available:')
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        Item.show_all(knapsack_items.select(order))
+
+    weights = [all_weights[i] for i in order]
+    profits = [all_profits[i] for i in order]
+    item_ids = [knapsack_items.ids[i] for i in order]
+
+    if modulo > 1 and logging.getLogger().isEnabledFor(logging.INFO):
+        for i in order:
+            logging.info('Item {:4d}: {}'.format(knapsack_items.ids[i], digit_string(knapsack_items.weights[i], modulo)))
+            logging.info('Item {:4d}: {}'.format(knapsack_items.ids[i], digit_string(all_weights[i], modulo)))
+            logging.info('')
+
+    if engine == 'auto':
+        num_sums = estimate_subset_sums(weights, capacity)
+        engine = 'intervals' if num_sums <= MAX_INTERVAL_SUMS else 'branch'
+        if use_numpy and np is not None and is_integral(weights, capacity) \
+                and len(weights) * (capacity + 1) <= MAX_ARRAY_CELLS:
+            engine = 'array'
+        logging.info(f'Estimated {num_sums} subset sums, choosing the {engine} engine')
+    if engine == 'array' and not is_integral(weights, capacity):
+        logging.warning('The array engine needs integer weights, using the interval engine instead')
+        engine = 'intervals'
+    report['engine'] = engine
+    report['optimal'] = True
+    metrics.count('remaining items', len(order))
+    if engine == 'middle':
+        with metrics.stage('meet in the middle'):
+            taking = meet_in_the_middle(weights, profits, capacity)
+    elif engine == 'array':
+        # the pure Python array is far slower than any other engine, so NumPy is used, whenever it is there
+        with metrics.stage('capacity array'):
+            taking = capacity_dp(weights, profits, capacity, np is not None)
+    elif engine == 'branch':
+        deadline = start_time + time_limit if time_limit is not None else None
+        with metrics.stage('branch and bound'):
+            _, taking, report['optimal'] = branch_and_bound(weights, profits, capacity, deadline)
+    elif low_memory:
+        # like the interval engine, the checkpointed one adds the times of its own stages within this one
+        with metrics.stage('checkpointed intervals'):
+            taking = interval_dp(weights, profits, capacity, item_ids, prune, use_numpy, workers, low_memory,
+                metrics)
+    else:
+        # the interval engine adds the times of its own stages, which run interleaved, within this one
+        with metrics.stage('intervals'):
+            taking = interval_dp(weights, profits, capacity, item_ids, prune, use_numpy, workers, low_memory,
+                metrics)
+
+    # always take the fixed and the zero-weight items
+    taken_indices = [order[step] for step in taking] + fixed_order + cheap_order
+
+    # the clean weights only approximate the real ones, so make the solution fit and fill it up
+    if knapsack_items.clean_weights is not knapsack_items.weights:
+        with metrics.stage('repair'):
+            taken_indices = repair_solution(knapsack_items, taken_indices, real_capacity)
+        upper_bound = dantzig_bound(knapsack_items.weights, knapsack_items.profits, real_capacity)
+        taken_profit = sum(knapsack_items.profits[i] for i in taken_indices)
+        report['gap'] = (upper_bound - taken_profit) / upper_bound if upper_bound > 0 else 0.
+        report['optimal'] = report['optimal'] and taken_profit >= upper_bound
+        logging.info(f'The total profit {taken_profit} is within {report["gap"]:.4%} of the upper bound {upper_bound}')
+    return collect_taken_items(knapsack_items, taken_indices)
+
+def collect_taken_items(knapsack_items, taken_indices):
+    taken_items = knapsack_items.select(taken_indices)
     taken_weight = sum(item.weight for item in taken_items)
     taken_profit = sum(item.profit for item in taken_items)
     logging.info(f'Pack following {len(taken_items)} items of total real weight {taken_weight} '
         + f'and total profit {taken_profit} in the Knapsack:')
-    for step in taking:
-        item = knapsack_items[step]
-        logging.info(f'Item {item.id}: {item}')
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        for item in taken_items:
+            logging.info('Item %s: %s', item.id, item)
 
     return taken_profit, taken_weight, taken_items
 
-if __name__ == '__main__':
+'''
+    Solves the Knapsack instance again and again, each time more exactly, and hands every improving solution
+    to the callback as soon as it is found. The first solution removes the digits at all given exponents of the
+    weights written in the modulo as base, and every next one removes one exponent less, the most important one,
+    until the last one removes none and is exact. Without given exponents, all exponents below the leading digit
+    of the heaviest item are removed at first.
+
+    Every solution warm-starts the next one: if it fits with the next clean weights, its total profit is a lower
+    bound for the reduction. The deadline is checked between the solutions; only the branch-and-bound engine is
+    stopped within one.
+
+    @param modulo the base, in which the digits of the weights are removed
+    @param removable_exponents optional list of the exponents to remove at first
+    @param deadline optional value of time.perf_counter(), after which no more exact solution is started
+    @param callback optional function, that is called with the total profit, the taken items, the removed
+        exponents and whether the solution is known to be optimal, for every improving solution
+    @param metrics optional Metrics, to which the stage times and counters of all solutions are added; a level
+        count of a step is the one of the latest solution reaching that step
+    @return total profit, total weight and taken items of the best solution, and whether it is known to be optimal
+'''
+def solve_anytime(knapsack_problem, modulo=10, removable_exponents=None, deadline=None, callback=None,
+        prune=True, use_numpy=False, reduce=True, engine='intervals', metrics=None):
+    capacity, knapsack_items = knapsack_problem
+    knapsack_items = ItemTable.from_items(knapsack_items)
+    if removable_exponents is None:
+        heaviest = max(knapsack_items.weights, default=0)
+        leading_exponent = 0
+        while modulo ** (leading_exponent + 1) <= heaviest:
+            leading_exponent += 1
+        removable_exponents = list(range(leading_exponent))
+    ladder = sorted(removable_exponents)
+    index_of_id = {item_id: i for i, item_id in enumerate(knapsack_items.ids)}
+
+    best = (-1, 0, [], False)
+    warm_start = None
+    for num_exponents in range(len(ladder), -1, -1):
+        time_limit = None
+        if deadline is not None:
+            time_limit = deadline - time.perf_counter()
+            if time_limit <= 0 and best[0] >= 0:
+                logging.info('Stopped refining, because the time is up')
+                break
+        exponents = ladder[:num_exponents]
+        report = dict()
+        taken_profit, taken_weight, taken_items = solve_knapsack((capacity, knapsack_items), modulo, list(exponents),
+            prune, use_numpy, reduce, engine, time_limit, report, warm_start=warm_start, metrics=metrics)
+        logging.info(f'Removing the exponents {exponents} gives total profit {taken_profit}')
+        if taken_profit > best[0] or (report['optimal'] and not best[3]):
+            best = (taken_profit, taken_weight, taken_items, report['optimal'])
+            warm_start = [index_of_id[item.id] for item in taken_items]
+            if callback is not None:
+                callback(taken_profit, taken_items, exponents, report['optimal'])
+        if report['optimal']:
+            break
+    return best
+
+'''
+    A Knapsack instance prepared for being solved with many different capacities.
+
+    The backward sums, and with them the budget intervals at every step, do not depend on the capacity,
+    so they are computed only once. Only the capacity decides which intervals are relevant. The maximum
+    total profit of an interval does not depend on the capacity either, so every interval's total profit is
+    remembered, and a later capacity only computes the intervals that no earlier capacity needed.
+
+    If a maximum capacity is given, the backward sums are pruned above it. A capacity beyond it makes
+    the backward sums be computed again, for the larger capacity, and forgets the remembered total profits.
+'''
+class PreparedKnapsack:
+    def __init__(self, knapsack_items, max_capacity=None, modulo=1, removable_exponents=[]):
+        self.knapsack_items = ItemTable.from_items(knapsack_items)
+        clean_item_weights(self.knapsack_items, modulo, removable_exponents)
+        self.order, self.cheap_order = order_items(self.knapsack_items)
+        self.weights = [self.knapsack_items.clean_weights[i] for i in self.order]
+        self.profits = [self.knapsack_items.profits[i] for i in self.order]
+        self.cheap_profit = sum(self.knapsack_items.profits[i] for i in self.cheap_order)
+        self.prepare(max_capacity)
+
+    def prepare(self, max_capacity):
+        self.max_capacity = max_capacity
+        self.accumulated_backward_sums = compute_backward_sums(self.weights[::-1], max_capacity)[::-1]
+
+        # the total profit of every interval computed so far, by the index of its lower boundary
+        self.total_profits = [dict() for _ in self.weights]
+
+    def get_total_profit(self, step, budget):
+        if step >= len(self.weights): return .0
+        epsilon = 1e-8
+        return self.total_profits[step][bisect_right(self.accumulated_backward_sums[step], budget + epsilon) - 1]
+
+    '''
+        Computes the total profits of all intervals, which are relevant for some of the given capacities,
+        and which were not computed before.
+    '''
+    def compute_total_profits(self, capacities):
+        if self.max_capacity is not None and max(capacities) > self.max_capacity:
+            logging.info(f'Preparing the Knapsack again for capacities up to {max(capacities)}')
+            self.prepare(max(capacities))
+
+        relevant_indices = compute_relevant_indices(self.accumulated_backward_sums, self.weights, capacities)
+        num_computed = 0
+        for step in range(len(self.weights))[::-1]:
+            boundaries = self.accumulated_backward_sums[step]
+            total_profits = self.total_profits[step]
+            weight = self.weights[step]
+            for i in relevant_indices[step]:
+                if i in total_profits:
+                    continue
+                lower_budget = boundaries[i]
+                max_total_profit = self.get_total_profit(step+1, lower_budget)
+                if weight <= lower_budget:
+                    one_total_profit = self.profits[step] + self.get_total_profit(step+1, lower_budget-weight)
+                    if one_total_profit > max_total_profit:
+                        max_total_profit = one_total_profit
+                total_profits[i] = max_total_profit
+                num_computed += 1
+        logging.info(f'Computed the total profits of {num_computed} new intervals')
+
+    '''
+        Solves the Knapsack instance for the given capacity.
+
+        @return the total profit, the total real weight and the list of taken items, like solve_knapsack
+    '''
+    def solve(self, capacity):
+        self.compute_total_profits([capacity])
+
+        # collect the items required to achieve the maximum total profit
+        taking = []
+        budget = capacity
+        for step in range(len(self.weights)):
+            if self.get_total_profit(step, budget) > self.get_total_profit(step+1, budget):
+                taking.append(step)
+                budget -= self.weights[step]
+
+        # always take the zero-weight items
+        taken_items = self.select_taken(taking)
+        taken_weight = sum(item.weight for item in taken_items)
+        taken_profit = sum(item.profit for item in taken_items)
+        return taken_profit, taken_weight, taken_items
+
+    def select_taken(self, taking):
+        return self.knapsack_items.select([self.order[step] for step in taking] + self.cheap_order)
+
+    '''
+        Computes the maximum total profit for every one of the given capacities, all in one pass.
+
+        @return list of the maximum total profits, in the order of the given capacities
+    '''
+    def solve_many(self, capacities):
+        capacities = list(capacities)
+        if not capacities: return []
+        self.compute_total_profits(capacities)
+        return [self.get_total_profit(0, capacity) + self.cheap_profit for capacity in capacities]
+
+# the fraction of the items of a session, up to which the core left by the reduction is solved from scratch
+MAX_SESSION_CORE = 0.5
+
+'''
+    A Knapsack instance, whose items and capacity change a little between solves.
+
+    The items are kept sorted by weight, and the backward sums and the total profits at some step only
+    depend on the items from this step on. So when an item is added or removed at some position, everything
+    after this position is kept as it is, and only the steps up to this position are computed again,
+    every step's backward sums from the next step's by a single merge.
+
+    The backward sums are pruned above the largest capacity so far; a larger capacity prepares everything again.
+    They are only computed again, when a solve needs them: every solve first reduces the current items like
+    solve_knapsack does, and if the reduction leaves at most MAX_SESSION_CORE of them, solving the core from
+    scratch is cheaper than any reuse, so the current items are handed to solve_knapsack instead.
+'''
+class KnapsackSession(PreparedKnapsack):
+    def __init__(self, knapsack_problem):
+        capacity, knapsack_items = knapsack_problem
+        PreparedKnapsack.__init__(self, knapsack_items, capacity)
+        self.capacity = capacity
+
+        # the last step, whose backward sums are out of date, or -1 if none is
+        self.stale_position = -1
+        self.ids = [self.knapsack_items.ids[i] for i in self.order]
+        self.cheap_items = self.knapsack_items.select(self.cheap_order)
+        self.ignored_items = self.knapsack_items.select(i for i in range(len(self.knapsack_items))
+            if self.knapsack_items.profits[i] == 0)
+
+    def add_item(self, item_id, weight, profit):
+        item = Item(item_id, weight, profit)
+        if profit == 0:
+            self.ignored_items.append(item)
+        elif weight == 0:
+            self.cheap_items.append(item)
+            self.cheap_profit += profit
+        else:
+            position = bisect_right(self.weights, weight)
+            self.ids.insert(position, item_id)
+            self.weights.insert(position, weight)
+            self.profits.insert(position, profit)
+            self.accumulated_backward_sums.insert(position, None)
+            self.total_profits.insert(position, dict())
+            self.mark_stale(position, 1)
+
+    def remove_item(self, item_id):
+        for items in (self.ignored_items, self.cheap_items):
+            for i, item in enumerate(items):
+                if item.id == item_id:
+                    del items[i]
+                    if items is self.cheap_items:
+                        self.cheap_profit -= item.profit
+                    return
+        position = self.ids.index(item_id)
+        del self.ids[position]
+        del self.weights[position]
+        del self.profits[position]
+        del self.accumulated_backward_sums[position]
+        del self.total_profits[position]
+        self.mark_stale(position, -1)
+
+    def update_capacity(self, capacity):
+        self.capacity = capacity
+        if self.max_capacity is not None and capacity > self.max_capacity:
+            logging.info(f'Preparing the Knapsack again for capacity {capacity}')
+            self.prepare(capacity)
+            self.stale_position = -1
+
+    '''
+        Marks the steps before the given position as out of date, and the step at it, if a step was inserted
+        there, after one step was inserted (num_inserted 1) or removed (num_inserted -1) at this position.
+    '''
+    def mark_stale(self, position, num_inserted):
+        if position <= self.stale_position:
+            self.stale_position += num_inserted
+        self.stale_position = max(self.stale_position, position if num_inserted > 0 else position - 1)
+
+    '''
+        Computes the backward sums of the given step and all steps before it again, and forgets
+        their total profits.
+    '''
+    def recompute_up_to(self, position):
+        sums = [0]
+        if position + 1 < len(self.weights):
+            sums += self.accumulated_backward_sums[position+1][1:-1]
+        for step in range(position, -1, -1):
+            sums = add_to_sums(sums, self.weights[step], self.max_capacity)
+            self.accumulated_backward_sums[step] = [-float('inf')] + sums[1:] + [float('inf')]
+            self.total_profits[step] = dict()
+        logging.info(f'Computed the backward sums of {position+1} steps again')
+
+    def solve(self):
+        remaining = reduce_items(self.weights, self.profits, self.capacity)[0]
+        if len(remaining) <= MAX_SESSION_CORE * len(self.weights):
+            logging.info(f'The reduction leaves {len(remaining)} of {len(self.weights)} items, solving from scratch')
+            knapsack_items = ItemTable(self.ids, self.weights, self.profits)
+            taken_profit, taken_weight, taken_items = solve_knapsack((self.capacity, knapsack_items))
+            return taken_profit + self.cheap_profit, taken_weight, list(taken_items) + self.cheap_items
+        if self.stale_position >= 0:
+            self.recompute_up_to(self.stale_position)
+            self.stale_position = -1
+        return PreparedKnapsack.solve(self, self.capacity)
+
+    def select_taken(self, taking):
+        taken_items = [Item(self.ids[step], self.weights[step], self.profits[step]) for step in taking]
+        return taken_items + self.cheap_items
+
+'''
+    Remembers the solutions of Knapsack instances, so that an instance seen before is not solved again.
+
+    Two instances are the same, if they have the same capacity, modulo and exponents, and the same multiset
+    of (weight, profit) pairs, no matter in which order the items are given and which ids they have. The key is
+    a hash of these, with the pairs sorted. A solution is stored as the positions of the taken items in this
+    sorted order, so it can be mapped back to the ids of any instance with the same key.
+
+    The solutions are kept in memory for the most recently used instances, up to the given number of them.
+    If a directory is given, they are also written there, one file per instance, and the least recently used
+    files are deleted when all of them together take more than the given number of bytes.
+'''
+class SolutionCache:
+    def __init__(self, max_entries=1024, directory=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    '''
+        @return the key of the given instance, and the order of its items sorted by (weight, profit)
+    '''
+    def canonicalize(self, knapsack_problem, modulo, removable_exponents):
+        capacity, knapsack_items = knapsack_problem
+        pairs = list(zip(knapsack_items.weights, knapsack_items.profits))
+        order = sorted(range(len(pairs)), key=pairs.__getitem__)
+        canonical = json.dumps([capacity, modulo, sorted(removable_exponents), [pairs[i] for i in order]])
+        return hashlib.sha256(canonical.encode()).hexdigest(), order
+
+    def entry_path(self, key):
+        return path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        taken_positions = self.entries.get(key)
+        if taken_positions is not None:
+            self.entries.move_to_end(key)
+        elif self.directory is not None:
+            try:
+                with open(self.entry_path(key)) as f:
+                    taken_positions = json.load(f)
+                os.utime(self.entry_path(key))
+            except (OSError, ValueError):
+                taken_positions = None
+            if taken_positions is not None:
+                self.remember(key, taken_positions)
+        if taken_positions is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return taken_positions
+
+    '''
+        Remembers the solution of the given key, and writes it to the directory, if there is one. The file is
+        written under a temporary name and then renamed, so that other processes sharing the directory never
+        read a partial file.
+    '''
+    def put(self, key, taken_positions):
+        self.remember(key, taken_positions)
+        if self.directory is not None:
+            temporary_path = f'{self.entry_path(key)}.{os.getpid()}.tmp'
+            try:
+                with open(temporary_path, 'w') as f:
+                    json.dump(taken_positions, f)
+                os.replace(temporary_path, self.entry_path(key))
+            except OSError:
+                if path.exists(temporary_path):
+                    os.remove(temporary_path)
+                raise
+            self.evict_files()
+
+    def remember(self, key, taken_positions):
+        if self.max_entries <= 0: return
+        self.entries[key] = taken_positions
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    '''
+        Removes the least recently used files of the directory, until they take at most max_bytes. Other
+        processes sharing the directory may remove the same files meanwhile, which is skipped.
+    '''
+    def evict_files(self):
+        if self.max_bytes is None: return
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try: stat = os.stat(path.join(self.directory, name))
+                except FileNotFoundError: continue
+                files.append((stat.st_mtime_ns, stat.st_size, name))
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total_bytes <= self.max_bytes: break
+            try: os.remove(path.join(self.directory, name))
+            except FileNotFoundError: pass
+            total_bytes -= size
+
+def make_argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--modulo', '-m', type=int, default=1)
     parser.add_argument('--info', '-i', type=str, default=None)
     parser.add_argument('--exponents', '-e', type=int, action='append', default=[])
+    parser.add_argument('--no-prune', dest='prune', action='store_false')
+    parser.add_argument('--numpy', action='store_true')
+    parser.add_argument('--no-reduce', dest='reduce', action='store_false')
+    parser.add_argument('--engine', choices=['intervals', 'array', 'middle', 'branch', 'auto'], default='intervals')
+    parser.add_argument('--time-limit', type=float, default=None)
+    parser.add_argument('--approximate', '-a', type=float, default=None)
+    parser.add_argument('--anytime', action='store_true')
+    parser.add_argument('--cache', action='store_true')
+    parser.add_argument('--memo', action='store_true')
+    parser.add_argument('--memo-size', type=int, default=1024)
+    parser.add_argument('--memo-dir', type=str, default=None)
+    parser.add_argument('--memo-bytes', type=int, default=None)
+    parser.add_argument('--serve', action='store_true')
+    parser.add_argument('--workers', '-w', type=int, default=None)
+    parser.add_argument('--level-workers', type=int, default=None)
+    parser.add_argument('--low-memory', action='store_true')
+    parser.add_argument('--trace', action='store_true')
     parser.add_argument('--verbose', '-v', action='count')
+    parser.add_argument('input_path', type=str, nargs='?', default=None)
+    return parser
+
+# the solution cache of this process, shared by all instances solved in it
+process_cache = None
+
+'''
+    Gets the solution cache of this process as configured on the command line, creating it on first use.
+
+    @return the cache, or None if caching is not asked for
+'''
+def get_process_cache(args):
+    global process_cache
+    if not args.memo and args.memo_dir is None:
+        return None
+    if process_cache is None:
+        process_cache = SolutionCache(args.memo_size, args.memo_dir, args.memo_bytes)
+    return process_cache
+
+'''
+    Solves the given Knapsack instance with the options given on the command line.
+
+    If a solution cache is given, the instance is only solved if the cache does not know it yet.
+    If metrics are given, the stage times and level counts of the solve are recorded in them.
+'''
+def solve_with_args(knapsack_problem, args, cache=None, report=None, metrics=None):
+    if report is None:
+        report = dict()
+    capacity, knapsack_items = knapsack_problem
+    knapsack_items = ItemTable.from_items(knapsack_items)
+    if cache is not None:
+        key, order = cache.canonicalize((capacity, knapsack_items), args.modulo, args.exponents)
+        taken_positions = cache.get(key)
+        if taken_positions is not None:
+            logging.info('Found the solution of this Knapsack instance in the cache')
+            taken_items = knapsack_items.select([order[position] for position in taken_positions])
+            report['optimal'] = True
+            return sum(item.profit for item in taken_items), sum(item.weight for item in taken_items), taken_items
+
+    taken_profit, used_capacity, taken_items = solve_knapsack((capacity, knapsack_items), args.modulo, args.exponents,
+        args.prune, args.numpy, args.reduce, args.engine, args.time_limit, report, args.approximate,
+        workers=args.level_workers, low_memory=args.low_memory, metrics=metrics)
+    if not report['optimal']:
+        logging.warning(f'The solution with total profit {taken_profit} may not be optimal')
+
+    # only optimal solutions are worth remembering
+    if cache is not None and report['optimal']:
+        position_of_id = {knapsack_items.ids[i]: position for position, i in enumerate(order)}
+        cache.put(key, sorted(position_of_id[item.id] for item in taken_items))
+    return taken_profit, used_capacity, taken_items
+
+'''
+    Writes the total profit and then, for every item of the instance in the order of their ids,
+    1 if it is taken and 0 otherwise.
+'''
+def write_solution(file, knapsack_items, taken_profit, taken_items):
+    taken_ids = {item.id for item in taken_items}
+    lines = [f'p {taken_profit}\n']
+    lines.extend('1\n' if item_id in taken_ids else '0\n' for item_id in sorted(knapsack_items.ids))
+    file.write(''.join(lines))
+
+'''
+    Solves one request of the JSON lines service. A request is a JSON object with a capacity, a list of weights
+    and a list of profits. It may have an id, a list of item ids (by default the items are numbered from 1),
+    a modulo and exponents; the other solver options come from the command line.
+
+    @return JSON object with the request's id, the total profit and weight, the taken item ids, whether they are
+        known to be optimal, their gap to the upper bound and the runtime
+'''
+def solve_request(request, args):
+    start_time = time.perf_counter()
+    try:
+        weights = request['weights']
+        profits = request['profits']
+        if len(weights) != len(profits):
+            raise ValueError('There must be as many weights as profits')
+        ids = request.get('ids', range(1, len(weights)+1))
+        if len(ids) != len(weights):
+            raise ValueError('There must be as many ids as weights')
+        knapsack_problem = (request['capacity'], ItemTable(ids, weights, profits))
+        request_args = argparse.Namespace(**vars(args))
+        request_args.modulo = request.get('modulo', args.modulo)
+        request_args.exponents = list(request.get('exponents', args.exponents))
+        cache = get_process_cache(args)
+        hits = cache.hits if cache is not None else 0
+        report = dict()
+        taken_profit, used_capacity, taken_items = solve_with_args(knapsack_problem, request_args, cache, report)
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        return {'id': request.get('id'), 'error': f'{type(e).__name__}: {e}'}
+    result = {
+        'id': request.get('id'),
+        'total_profit': taken_profit,
+        'total_weight': used_capacity,
+        'taken_ids': sorted(item.id for item in taken_items),
+        'optimal': report['optimal'],
+        'gap': report.get('gap', 0.),
+        'runtime': time.perf_counter() - start_time
+    }
+    if cache is not None:
+        result['cached'] = cache.hits > hits
+    return result
+
+'''
+    Reads one JSON request per line from the input and writes one JSON result per line to the output.
+    The requests are solved concurrently in a pool of worker processes, and every result is written
+    as soon as it is finished, so the results come out of order and are matched to the requests by their ids.
+    At most twice as many requests as there are workers are read ahead.
+'''
+def serve(input_file, output_file, args, workers=None):
+    workers = workers or os.cpu_count() or 1
+    pending = {}
+
+    def write_result(result):
+        output_file.write(json.dumps(result) + '\n')
+        output_file.flush()
+
+    def write_finished():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            request_id = pending.pop(future)
+            try:
+                write_result(future.result())
+            except Exception as e:
+                write_result({'id': request_id, 'error': f'{type(e).__name__}: {e}'})
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for line in input_file:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('A request must be a JSON object')
+            except ValueError as e:
+                write_result({'id': None, 'error': f'{type(e).__name__}: {e}'})
+                continue
+            pending[executor.submit(solve_request, request, args)] = request.get('id')
+            if len(pending) >= 2 * workers:
+                write_finished()
+        while pending:
+            write_finished()
+
+if __name__ == '__main__':
+    parser = make_argument_parser()
     args = parser.parse_args()
 
     log_levels = {
@@ -367,34 +2342,63 @@ if __name__ == '__main__':
     if args.modulo < 1:
         logging.error('Modulo must be at least 1!')
         exit(1)
+    if args.approximate is not None and args.approximate <= 0:
+        logging.error('The target error must be positive!')
+        exit(1)
+
+    if args.serve:
+        serve(sys.stdin, sys.stdout, args, args.workers)
+        exit(0)
+
+    # trace every record of the metrics as one JSON line on stderr
+    hooks = []
+    if args.trace:
+        def write_record(name, value, step):
+            sys.stderr.write(json.dumps({'name': name, 'value': value, 'step': step}) + '\n')
+        hooks.append(write_record)
+    metrics = Metrics(hooks)
 
     # parse the knapsack instance from given file
     start_time = time.time()
-    knapsack_problem = parse_knapsack(sys.stdin)
+    with metrics.stage('parsing'):
+        if args.input_path is not None:
+            knapsack_problem = load_knapsack(args.input_path, args.cache)
+        else:
+            knapsack_problem = parse_knapsack(sys.stdin)
     if knapsack_problem is None:
-        logging.error('Could not parse the knapsack instance given through stdin')
+        logging.error('Could not parse the knapsack instance, because it has no capacity line')
         exit(1)
-    capacity = knapsack_problem[0]
-    taken_profit, used_capacity, taken_items = solve_knapsack(knapsack_problem, args.modulo, args.exponents)
-    if used_capacity > capacity:
-        logging.warning('Knapsack problem solved incorrectly with the modulo, solving again without it..')
-        taken_profit, used_capacity, taken_items = solve_knapsack((capacity, taken_items))
-    taken_time = time.time() - start_time
-
-    sys.stdout.write(f'p {taken_profit}\n')
-    knapsack_items = knapsack_problem[1]
-    all_ids = [item.id for item in knapsack_items]
-    taken_ids = [item.id for item in taken_items]
-    for item_id in sorted(all_ids):
-        if item_id in taken_ids:
-            sys.stdout.write('1\n')
-        else:
-            sys.stdout.write('0\n')
+    if args.anytime:
+        # stream every improving solution as one JSON line
+        def write_improvement(taken_profit, taken_items, exponents, optimal):
+            improvement = {
+                'total_profit': taken_profit,
+                'taken_ids': sorted(item.id for item in taken_items),
+                'exponents': exponents,
+                'optimal': optimal,
+                'runtime': time.time() - start_time
+            }
+            sys.stdout.write(json.dumps(improvement) + '\n')
+            sys.stdout.flush()
+        deadline = time.perf_counter() + args.time_limit if args.time_limit is not None else None
+        taken_profit, _, _, _ = solve_anytime(knapsack_problem, args.modulo if args.modulo > 1 else 10,
+            args.exponents or None, deadline, write_improvement, args.prune, args.numpy, args.reduce, args.engine,
+            metrics)
+        taken_time = time.time() - start_time
+    else:
+        cache = get_process_cache(args)
+        taken_profit, used_capacity, taken_items = solve_with_args(knapsack_problem, args, cache, metrics=metrics)
+        taken_time = time.time() - start_time
+        if cache is not None:
+            logging.info(f'Solution cache: {cache.stats()}')
+
+        write_solution(sys.stdout, knapsack_problem[1], taken_profit, taken_items)
 
     if args.info is not None:
         info = {
             'runtime': taken_time,
-            'total_profit': taken_profit
+            'total_profit': taken_profit,
+            'metrics': metrics.to_dict()
         }
         with open(args.info, 'w') as f:
             f.write(json.dumps(info, indent=4))
@@ -30,6 +30,7 @@ class Item:
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--basename', '-b', required=True)
+    parser.add_argument('--solutions', '-s', type=str, default=None)
     parser.add_argument('--verbose', '-v', action='count')
     args = parser.parse_args()
 
@@ -62,3 +63,13 @@ if __name__ == '__main__':
             for item in knapsack.items:
                 f.write(f'{item.weight} {item.profit}\n')
     file.close()
+
+    # the solution lines look like the instance lines, but with the optimal total profit in third place
+    if args.solutions is not None:
+        with open(args.solutions) as file:
+            for line in file:
+                info = line.split()
+                if len(info) < 3:
+                    continue
+                with open(f'kp/{args.basename}_{info[0]}.opt', 'w') as f:
+                    f.write(f'p {info[2]}\n')
@@ -1,3 +1,4 @@
+import os
 import sys
 import subprocess
 from os import path
@@ -5,6 +6,9 @@ import json
 import time
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import knapsack
 
 def measure_runtime(command_list, input_filepath, output_filepath, index, amount, often):
     runtimes = []
@@ -32,9 +36,96 @@ def measure_runtime(command_list, input_filepath, output_filepath, index, amount
             output_file.close()
     return runtimes
 
+'''
+    Expands the given paths into a list of .kp files. Files are taken as they are, and directories
+    are replaced by the .kp files inside them, in sorted order.
+'''
+def collect_input_paths(input_paths):
+    filepaths = []
+    for input_path in input_paths:
+        if path.isdir(input_path):
+            filepaths.extend(sorted(path.join(input_path, name) for name in os.listdir(input_path)
+                if name.endswith('.kp')))
+        else:
+            filepaths.append(input_path)
+    return filepaths
+
+'''
+    Parses the solver options for the batch mode out of the given solver command, for example
+    'python knapsack.py -m 10'. Everything after knapsack.py is parsed like knapsack.py itself would.
+'''
+def parse_solver_args(command):
+    command_list = command.split() if command else []
+    for i, token in enumerate(command_list):
+        if token.endswith('knapsack.py'):
+            command_list = command_list[i+1:]
+            break
+    return knapsack.make_argument_parser().parse_args(command_list)
+
+'''
+    Solves the given instance file 'often' times inside the current process and writes the last solution
+    to the output file, if there is one.
+
+    @return list of runtimes, each including the parsing of the instance
+'''
+def solve_file(input_filepath, output_filepath, often, solver_args):
+    runtimes = []
+    for _ in range(often):
+        start = time.time()
+        knapsack_problem = knapsack.load_knapsack(input_filepath, solver_args.cache)
+        if knapsack_problem is None:
+            raise ValueError(f'{input_filepath} has no capacity line')
+        taken_profit, _, taken_items = knapsack.solve_with_args(knapsack_problem, solver_args,
+            knapsack.get_process_cache(solver_args))
+        runtimes.append(time.time() - start)
+    if output_filepath is not None:
+        with open(output_filepath, 'w') as output_file:
+            knapsack.write_solution(output_file, knapsack_problem[1], taken_profit, taken_items)
+    return runtimes
+
+'''
+    Sets the log level of a worker process to the verbosity of the solver command, instead of the
+    verbosity inherited from this script.
+'''
+def init_worker(verbose):
+    log_levels = {
+        None: logging.WARNING,
+        1: logging.INFO,
+        2: logging.DEBUG
+    }
+    logging.getLogger().setLevel(log_levels[min(verbose, 2) if verbose is not None else None])
+
+'''
+    Solves all given instance files in a pool of worker processes, so that no instance pays for starting
+    a new interpreter. The results are yielded as soon as they are finished, not in the given order.
+
+    @return generator of pairs of input file path and list of runtimes, or None if solving failed
+'''
+def measure_batch(input_filepaths, extension, often, solver_args, workers):
+    with ProcessPoolExecutor(max_workers=workers,
+            initializer=init_worker, initargs=(solver_args.verbose,)) as executor:
+        futures = {}
+        for filepath in input_filepaths:
+            output_filepath = filepath + extension if extension else None
+            future = executor.submit(solve_file, filepath, output_filepath, often, solver_args)
+            futures[future] = filepath
+        for index, future in enumerate(as_completed(futures)):
+            filepath = futures[future]
+            try:
+                runtimes = future.result()
+            except Exception as e:
+                logging.error(f'Solver executed abnormally! Skipping {filepath}.')
+                logging.error(e)
+                runtimes = None
+            else:
+                logging.info(f'#{index+1}/{len(futures)} INPUT {filepath} ran in {runtimes}s')
+            yield filepath, runtimes
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--command', '-c', required=True)
+    parser.add_argument('--command', '-c', default=None)
+    parser.add_argument('--batch', '-b', action='store_true')
+    parser.add_argument('--workers', '-w', type=int, default=None)
     parser.add_argument('--often', '-o', type=int, default=1)
     parser.add_argument('--extension', '-e', type=str, default='')
     parser.add_argument('--verbose', '-v', action='count')
@@ -50,25 +141,32 @@ if __name__ == '__main__':
         args.verbose = len(log_levels)-1
     logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
 
+    if args.command is None and not args.batch:
+        logging.error('A solver command is needed, unless solving in batch mode!')
+        exit(1)
+
     try:
         with open('info.json') as f: info = json.load(f)
     except:
         info = {}
 
-    for index, filepath in enumerate(args.input_paths):
-        if args.extension:
-            output_filepath = filepath + args.extension
-        else:
-            output_filepath = None
-
-        runtimes = measure_runtime(
+    if args.batch:
+        input_filepaths = collect_input_paths(args.input_paths)
+        results = measure_batch(input_filepaths, args.extension, args.often,
+            parse_solver_args(args.command), args.workers)
+    else:
+        input_filepaths = args.input_paths
+        results = ((filepath, measure_runtime(
             args.command.split(),
             filepath,
-            output_filepath,
+            filepath + args.extension if args.extension else None,
             index+1,
-            len(args.input_paths),
-            args.often)
+            len(input_filepaths),
+            args.often)) for index, filepath in enumerate(input_filepaths))
 
+    for filepath, runtimes in results:
+        if runtimes is None:
+            continue
         _, basename = path.split(filepath)
         dot_index = basename.rfind('.')
         basename = basename[:dot_index]
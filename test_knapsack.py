@@ -0,0 +1,327 @@
+import io
+import itertools
+import json
+import os
+import random
+import time
+from array import array
+
+import pytest
+
+import knapsack
+
+'''
+    Makes a random instance with a few items, some of which have zero weight or zero profit. With floats,
+    some weights get a fractional part.
+
+    @return the capacity and the list of items, like knapsack.parse_knapsack
+'''
+def make_instance(seed, num_items, max_weight, floats=False):
+    rng = random.Random(seed)
+    knapsack_items = []
+    for item_id in range(1, num_items+1):
+        weight = rng.randint(0, max_weight) if rng.random() < 0.1 else rng.randint(1, max_weight)
+        profit = 0 if rng.random() < 0.1 else rng.randint(1, max_weight)
+        if floats:
+            weight += rng.choice([0, 0.5, 0.25])
+        knapsack_items.append(knapsack.Item(item_id, weight, profit))
+    capacity = int(sum(item.weight for item in knapsack_items) * rng.choice([0.3, 0.5, 0.8]))
+    return capacity, knapsack_items
+
+'''
+    Finds the optimal total profit by trying every subset of the items.
+'''
+def brute_force(knapsack_problem):
+    capacity, knapsack_items = knapsack_problem
+    best = 0
+    for taken in itertools.product([False, True], repeat=len(knapsack_items)):
+        chosen = [item for item, take in zip(knapsack_items, taken) if take]
+        if sum(item.weight for item in chosen) <= capacity:
+            best = max(best, sum(item.profit for item in chosen))
+    return best
+
+INSTANCES = [(seed, 1 + seed % 12, [5, 20, 100][seed % 3], seed % 5 == 0) for seed in range(60)]
+
+@pytest.mark.parametrize('seed, num_items, max_weight, floats', INSTANCES)
+def test_pruning_keeps_the_optimum(seed, num_items, max_weight, floats):
+    knapsack_problem = make_instance(seed, num_items, max_weight, floats)
+    optimum = brute_force(knapsack_problem)
+    for reduce in [True, False]:
+        pruned = knapsack.solve_knapsack(knapsack_problem, prune=True, reduce=reduce)
+        unpruned = knapsack.solve_knapsack(knapsack_problem, prune=False, reduce=reduce)
+        assert pruned[0] == unpruned[0] == optimum
+        assert pruned[1] <= knapsack_problem[0]
+        assert unpruned[1] <= knapsack_problem[0]
+
+def test_truncated_sidecar_is_stale(tmp_path):
+    filepath = str(tmp_path / 'instance.kp')
+    with open(filepath, 'w') as f:
+        f.write('t 50\n' + ''.join(f'{weight} {weight + 1}\n' for weight in range(1, 41)))
+    parsed = knapsack.load_knapsack(filepath, cache=True)
+    cached = knapsack.read_sidecar(filepath)
+    assert list(cached[1].profits) == list(parsed[1].profits)
+    del cached
+
+    with open(knapsack.sidecar_path(filepath), 'r+b') as f:
+        f.truncate(knapsack.KPB_HEADER.size + 40 * 8 * 2 + 10 * 8)
+    assert knapsack.read_sidecar(filepath) is None
+    reloaded = knapsack.load_knapsack(filepath, cache=True)
+    assert knapsack.solve_knapsack(reloaded)[0] == knapsack.solve_knapsack(parsed)[0]
+    assert not [name for name in tmp_path.iterdir() if name.suffix == '.tmp']
+
+@pytest.mark.parametrize('seed, num_items, max_weight, floats', [instance for instance in INSTANCES if not instance[3]])
+@pytest.mark.parametrize('numpy', [None, knapsack.np])
+def test_capacity_array_agrees_with_intervals(monkeypatch, seed, num_items, max_weight, floats, numpy):
+    knapsack_problem = make_instance(seed, num_items, max_weight)
+    optimum = brute_force(knapsack_problem)
+    intervals = knapsack.solve_knapsack(knapsack_problem, reduce=False, engine='intervals')
+    monkeypatch.setattr(knapsack, 'np', numpy)
+    array = knapsack.solve_knapsack(knapsack_problem, reduce=False, engine='array')
+    assert array[0] == intervals[0] == optimum
+    assert array[1] <= knapsack_problem[0]
+
+@pytest.mark.parametrize('max_bitset_capacity', [knapsack.MAX_BITSET_CAPACITY, 0])
+def test_parallel_intervals_agree_with_serial(monkeypatch, max_bitset_capacity):
+    monkeypatch.setattr(knapsack, 'MAX_BITSET_CAPACITY', max_bitset_capacity)
+    rng = random.Random(7)
+    weights = sorted(rng.randint(1, 300) for _ in range(knapsack.MIN_PARALLEL_STEPS + 6))
+    capacity = sum(weights) // 3
+    accumulated_backward = knapsack.compute_backward_sums(weights[::-1], capacity)[::-1]
+    for capacities in [[capacity], [capacity, capacity // 2]]:
+        serial = knapsack.compute_relevant_indices(accumulated_backward, weights, capacities)
+        parallel = knapsack.compute_relevant_indices(accumulated_backward, weights, capacities, workers=2)
+        assert parallel == serial
+
+@pytest.mark.parametrize('seed, num_items, max_weight, floats', INSTANCES)
+def test_checkpointed_intervals_keep_the_optimum(seed, num_items, max_weight, floats):
+    knapsack_problem = make_instance(seed, num_items, max_weight, floats)
+    optimum = brute_force(knapsack_problem)
+    for use_numpy in [False, True]:
+        checkpointed = knapsack.solve_knapsack(knapsack_problem, use_numpy=use_numpy, reduce=False, low_memory=True)
+        assert checkpointed[0] == optimum
+        assert checkpointed[1] <= knapsack_problem[0]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_checkpointed_intervals_count_the_same_levels(seed):
+    rng = random.Random(seed)
+    weights = sorted(rng.randint(1, 50) for _ in range(20))
+    profits = [rng.randint(1, 50) for _ in weights]
+    capacity = sum(weights) // 2
+    metrics, checkpointed_metrics = knapsack.Metrics(), knapsack.Metrics()
+    knapsack.interval_dp(weights, profits, capacity, list(range(len(weights))), metrics=metrics)
+    knapsack.interval_dp(weights, profits, capacity, list(range(len(weights))), low_memory=True,
+        metrics=checkpointed_metrics)
+    assert checkpointed_metrics.level_counts == metrics.level_counts
+    assert set(checkpointed_metrics.stage_times) == set(metrics.stage_times)
+
+@pytest.mark.parametrize('seed', range(40))
+def test_reduction_keeps_the_optimum_of_decimal_weights(seed):
+    rng = random.Random(seed)
+    knapsack_items = [knapsack.Item(item_id, rng.randint(10, 100) / 10, rng.randint(1, 20))
+        for item_id in range(1, rng.randint(2, 12))]
+    capacity = round(sum(item.weight for item in knapsack_items) * rng.choice([0.3, 0.5, 0.8]), 1)
+    for engine in ['middle', 'branch']:
+        reduced = knapsack.solve_knapsack((capacity, knapsack_items), engine=engine)
+        unreduced = knapsack.solve_knapsack((capacity, knapsack_items), engine=engine, reduce=False)
+        assert reduced[0] == unreduced[0]
+        assert reduced[1] <= capacity + 1e-9
+
+def test_bounds_are_exact_for_large_profits():
+    weights = [17, 10, 25, 20, 30, 23, 29, 10]
+    profits = [10**17 + profit for profit in [8, 8, 6, 16, 34, 38, 9, 6]]
+    knapsack_problem = (60, [knapsack.Item(i+1, weight, profit)
+        for i, (weight, profit) in enumerate(zip(weights, profits))])
+    assert knapsack.solve_knapsack(knapsack_problem, engine='array')[0] == brute_force(knapsack_problem)
+
+@pytest.mark.parametrize('seed, num_items, max_weight, floats', INSTANCES)
+def test_branch_and_bound_keeps_the_optimum(seed, num_items, max_weight, floats):
+    knapsack_problem = make_instance(seed, num_items, max_weight, floats)
+    branch = knapsack.solve_knapsack(knapsack_problem, reduce=False, engine='branch')
+    assert branch[0] == brute_force(knapsack_problem)
+    assert branch[1] <= knapsack_problem[0]
+
+def test_branch_and_bound_is_exact_for_large_profits():
+    weights = [26, 14, 14, 16, 24, 3, 3, 12]
+    profits = [10**17 + profit for profit in [28, 43, 1, 20, 16, 22, 7, 44]]
+    knapsack_problem = (60, [knapsack.Item(i+1, weight, profit)
+        for i, (weight, profit) in enumerate(zip(weights, profits))])
+    assert knapsack.solve_knapsack(knapsack_problem, reduce=False, engine='branch')[0] == brute_force(knapsack_problem)
+
+@pytest.mark.parametrize('seed, num_items, max_weight, floats', INSTANCES)
+def test_meet_in_the_middle_keeps_the_optimum(seed, num_items, max_weight, floats):
+    knapsack_problem = make_instance(seed, num_items, max_weight, floats)
+    middle = knapsack.solve_knapsack(knapsack_problem, reduce=False, engine='middle')
+    assert middle[0] == brute_force(knapsack_problem)
+    assert middle[1] <= knapsack_problem[0]
+
+def test_solution_cache_keeps_the_most_recently_used():
+    cache = knapsack.SolutionCache(max_entries=2)
+    cache.put('a', [0])
+    cache.put('b', [1])
+    assert cache.get('a') == [0]
+    cache.put('c', [2])
+    assert cache.get('b') is None
+    assert cache.get('a') == [0] and cache.get('c') == [2]
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'entries': 2}
+
+def test_solution_cache_reloads_from_its_directory(tmp_path):
+    knapsack.SolutionCache(directory=str(tmp_path)).put('a', [0, 2])
+    cache = knapsack.SolutionCache(directory=str(tmp_path))
+    assert cache.get('a') == [0, 2]
+    assert cache.get('b') is None
+    assert not [name for name in tmp_path.iterdir() if name.suffix == '.tmp']
+
+def test_solution_cache_evicts_the_oldest_files(tmp_path):
+    cache = knapsack.SolutionCache(max_entries=0, directory=str(tmp_path), max_bytes=20)
+    for step, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, list(range(3)))
+        os.utime(cache.entry_path(key), ns=(step, step))
+    cache.evict_files()
+    assert sorted(name.name for name in tmp_path.iterdir()) == ['b.json', 'c.json']
+    assert cache.get('a') is None and cache.get('c') == [0, 1, 2]
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('max_session_core', [-1, 1])
+def test_session_updates_keep_the_optimum(monkeypatch, seed, max_session_core):
+    monkeypatch.setattr(knapsack, 'MAX_SESSION_CORE', max_session_core)
+    rng = random.Random(seed)
+    capacity, knapsack_items = make_instance(seed, 6, 30)
+    session = knapsack.KnapsackSession((capacity, list(knapsack_items)))
+    next_id = len(knapsack_items) + 1
+    for _ in range(20):
+        kind = rng.choice(['add', 'remove', 'capacity'] if len(knapsack_items) < 11 else ['remove', 'capacity'])
+        if kind == 'add' or not knapsack_items:
+            item = knapsack.Item(next_id, rng.randint(0, 30), rng.randint(0, 30))
+            next_id += 1
+            knapsack_items.append(item)
+            session.add_item(item.id, item.weight, item.profit)
+        elif kind == 'remove':
+            session.remove_item(knapsack_items.pop(rng.randrange(len(knapsack_items))).id)
+        else:
+            capacity = rng.randint(0, 2 * capacity + 10)
+            session.update_capacity(capacity)
+        if rng.random() < 0.5:
+            # several updates may come before the next solve
+            continue
+        taken_profit, taken_weight, taken_items = session.solve()
+        assert taken_profit == brute_force((capacity, knapsack_items))
+        assert taken_weight == sum(item.weight for item in taken_items) <= capacity
+        assert taken_profit == sum(item.profit for item in taken_items)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_prepared_knapsack_agrees_with_solve_knapsack(seed):
+    capacity, knapsack_items = make_instance(seed, 10, 40)
+    max_capacity = None if seed % 2 else capacity
+    prepared = knapsack.PreparedKnapsack(knapsack_items, max_capacity)
+    capacities = [0, capacity // 3, capacity, capacity // 2, 2 * capacity]
+    expected = [knapsack.solve_knapsack((budget, knapsack_items))[0] for budget in capacities]
+    assert prepared.solve_many(capacities) == expected
+    for budget, taken_profit in zip(capacities, expected):
+        solved = prepared.solve(budget)
+        assert solved[0] == taken_profit
+        assert solved[1] <= budget
+
+'''
+    Removes the digits like the solver did with sparse numbers, a dictionary of the nonzero digits by exponent.
+'''
+def remove_sparse_digits(number, base, removable_exponents):
+    sparse = dict()
+    exponent = 0
+    while number > 0:
+        number, digit = divmod(number, base)
+        if digit > 0:
+            sparse[exponent] = digit
+        exponent += 1
+    exponents = sorted(removable_exponents, reverse=True)
+    if sparse.pop(exponents[0], 0) >= int(base / 2) + 1:
+        exponent = exponents[0] + 1
+        while sparse.get(exponent, 0) == base - 1:
+            del sparse[exponent]
+            exponent += 1
+        sparse[exponent] = sparse.get(exponent, 0) + 1
+    for exponent in exponents[1:]:
+        sparse.pop(exponent, 0)
+    return sum(digit * base**exponent for exponent, digit in sparse.items())
+
+@pytest.mark.parametrize('base, removable_exponents', [(10, [0]), (10, [1, 0]), (10, [2]), (2, [3, 1]), (7, [0, 2])])
+def test_remove_digits_matches_sparse_digits(base, removable_exponents):
+    rng = random.Random(base)
+    numbers = [rng.randint(0, 10**6) for _ in range(200)] + [999, 995, 994, 0, base**3 - 1]
+    expected = [remove_sparse_digits(number, base, removable_exponents) for number in numbers]
+    assert knapsack.remove_digits(numbers, base, removable_exponents) == expected
+    assert knapsack.remove_digits(array('q', numbers), base, removable_exponents) == expected
+
+def test_scale_numbers_keeps_positive_numbers_positive():
+    numbers = [0, 1, 4, 5, 6, 149, 150, 151, 1000]
+    expected = [0, 1, 1, 1, 1, 1, 2, 2, 10]
+    assert knapsack.scale_numbers(numbers, 100) == expected
+    assert knapsack.scale_numbers(array('q', numbers), 100) == expected
+
+def test_repair_makes_the_solution_fit():
+    capacity, knapsack_items = make_instance(3, 12, 50)
+    knapsack_items = knapsack.ItemTable.from_items(knapsack_items)
+    taken_indices = knapsack.repair_solution(knapsack_items, range(len(knapsack_items)), capacity)
+    assert len(set(taken_indices)) == len(taken_indices)
+    assert sum(knapsack_items.weights[i] for i in taken_indices) <= capacity
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('options', [{'approximate': 0.05}, {'approximate': 0.3},
+    {'modulo': 10, 'removable_exponents': [0]}])
+def test_approximate_solution_is_within_its_gap(seed, options):
+    capacity, knapsack_items = make_instance(seed, 12, 200)
+    report = dict()
+    taken_profit, taken_weight, taken_items = knapsack.solve_knapsack((capacity, knapsack_items), report=report,
+        **options)
+    optimum = brute_force((capacity, knapsack_items))
+    upper_bound = knapsack.dantzig_bound([item.weight for item in knapsack_items],
+        [item.profit for item in knapsack_items], capacity)
+    assert taken_weight == sum(item.weight for item in taken_items) <= capacity
+    assert taken_profit <= optimum <= upper_bound + 1e-9
+    assert 0 <= report['gap'] <= 1
+    assert taken_profit >= (1 - report['gap']) * upper_bound - 1e-9
+
+@pytest.mark.parametrize('seed', range(10))
+def test_anytime_solution_ends_optimal(seed):
+    knapsack_problem = make_instance(seed, 12, 1000)
+    improvements = []
+    taken_profit, taken_weight, taken_items, optimal = knapsack.solve_anytime(knapsack_problem,
+        callback=lambda taken_profit, *_: improvements.append(taken_profit))
+    assert optimal
+    assert taken_profit == brute_force(knapsack_problem) == improvements[-1]
+    assert improvements == sorted(improvements)
+    assert taken_weight == sum(item.weight for item in taken_items) <= knapsack_problem[0]
+
+@pytest.mark.parametrize('engine', ['intervals', 'branch'])
+def test_anytime_solution_past_the_deadline_is_the_first_one(engine):
+    knapsack_problem = make_instance(5, 12, 1000)
+    first = knapsack.solve_knapsack(knapsack_problem, 10, [0, 1, 2], engine=engine)
+    taken_profit, taken_weight, taken_items, _ = knapsack.solve_anytime(knapsack_problem,
+        removable_exponents=[0, 1, 2], deadline=time.perf_counter() - 1, engine=engine)
+    assert (taken_profit, taken_weight) == first[:2]
+    assert taken_weight <= knapsack_problem[0]
+
+def test_serve_answers_every_request():
+    args = knapsack.make_argument_parser().parse_args([])
+    requests = [
+        json.dumps({'id': 'a', 'capacity': 10, 'weights': [5, 4, 6], 'profits': [10, 40, 30], 'ids': [7, 8, 9]}),
+        '{"id": "b", "capacity": ',
+        json.dumps({'id': 'c', 'capacity': 10, 'weights': [5, 4], 'profits': [10, 40], 'ids': [1]}),
+        json.dumps({'id': 'd', 'capacity': 10, 'weights': [5, 4], 'profits': [10]})
+    ]
+    output_file = io.StringIO()
+    knapsack.serve(io.StringIO('\n'.join(requests) + '\n'), output_file, args, workers=1)
+    results = [json.loads(line) for line in output_file.getvalue().splitlines()]
+    assert len(results) == 4
+    results = {result['id']: result for result in results}
+    assert results['a']['total_profit'] == 70 and results['a']['taken_ids'] == [8, 9] and results['a']['optimal']
+    assert results[None]['error'].startswith('JSONDecodeError')
+    assert results['c']['error'] == 'ValueError: There must be as many ids as weights'
+    assert results['d']['error'] == 'ValueError: There must be as many weights as profits'
+
+def test_parse_does_not_shift_items_across_malformed_lines():
+    capacity, knapsack_items = knapsack.parse_knapsack_bytes(b'c comment\nt 10\n1 2\n3 4 5\n6 7\n')
+    assert capacity == 10
+    assert list(knapsack_items.weights) == [1, 3, 6] and list(knapsack_items.profits) == [2, 4, 7]
+    for data in [b't 10\n1 2\n3\n4 5 6\n7 8\n', b't 10\n1 2\n4 5 6\n 3 \r\n', b'3\nt 10\n4 5 6\n']:
+        with pytest.raises(ValueError):
+            knapsack.parse_knapsack_bytes(data)